@@ -0,0 +1,203 @@
+# Local stand-ins shared by the benchmark (bench/run_bench.py) and the tests: the fixture pages and
+# updates, HTTP servers serving them, a fake Bot and an Application that never goes to the network.
+# Only imports the bounbot modules it needs, so a test using it doesn't load the whole bot.
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCH_DIR, 'fixtures')
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bounbot import parsing, sources
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+# --- Fixtures ---
+def load_fixtures() -> dict:
+    pages = {}
+    for typ in sources.SOURCES:
+        with open(os.path.join(FIXTURE_DIR, f'{typ}.html'), encoding='utf-8') as f:
+            pages[typ] = f.read()
+    return pages
+
+def load_webhook_updates() -> list[dict]:
+    # Sample updates in the Bot API format (commands, a text message, an edit, a block)
+    with open(os.path.join(FIXTURE_DIR, 'webhook_updates.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+# --- Stub Servers ---
+class FixtureServer:
+    # Serves the fixture pages with ETags like the live sites, `latency` seconds after each request.
+    # publish() puts new announcements on top of a page.
+    def __init__(self, pages: dict, latency=0.0):
+        self.pages = dict(pages)
+        self.latency = latency
+        self.requests = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                typ = self.path.strip('/')
+                if typ not in server.pages:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                server.requests[typ] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                body = server.pages[typ].encode('utf-8')
+                etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, typ):
+        return f'http://127.0.0.1:{self.httpd.server_port}/{typ}'
+
+    def publish(self, typ, titles: list[str]):
+        # Copies the markup of the newest announcement for every title (newest first)
+        html = self.pages[typ]
+        selector = sources.SOURCES[typ]['selector']
+        newest = parsing.extract_announcements(html, selector, 'bs4')[0]
+        at = html.index(newest)
+        start = html.rindex(f"<{selector['tag']}", 0, at)
+        end = html.index(f"</{selector['tag']}>", at) + len(selector['tag']) + 3
+        snippet = html[start:end]
+        self.pages[typ] = html[:start] + ''.join(snippet.replace(newest, title) + '\n' for title in titles) + html[start:]
+
+
+class StubServer:
+    # A host that misbehaves: 'flaky' answers 503 to `failure_rate` of the requests, 'failing' to its
+    # first `failures` requests (with a Retry-After of `retry_after` seconds when given), 'slow' answers
+    # after `delay` seconds (longer than the fetch timeout), 'redirect' sends every path but /moved
+    # there with a 301, 'healthy' always serves the page.
+    def __init__(self, page: str, behaviour: str, failure_rate=0.5, delay=0.0, seed=0, failures=0, retry_after=None):
+        self.requests = 0
+        rng = random.Random(seed)
+        body = page.encode('utf-8')
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                if behaviour == 'redirect' and self.path != '/moved':
+                    self.send_response(301)
+                    self.send_header('Location', '/moved')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if behaviour == 'slow':
+                    time.sleep(delay)
+                if (behaviour == 'flaky' and rng.random() < failure_rate) or (behaviour == 'failing' and server.requests <= failures):
+                    self.send_response(503)
+                    if retry_after is not None:
+                        self.send_header('Retry-After', str(retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError: # The client gave up on a slow answer
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_port}/'
+
+
+# --- Fake Telegram ---
+class FakeBot:
+    # Stands in for telegram.Bot in the dispatcher. Records send_message calls, waits `latency`
+    # seconds (+-50%) per call and fails `error_rate` of them with a mix of Telegram errors.
+    ERRORS = (('forbidden', 0.5), ('network', 0.4), ('retry_after', 0.1))
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.sent_chars = 0
+        self.chats = set()
+        self.errors = Counter()
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(0.5, 1.5))
+        if self.error_rate and self.random.random() < self.error_rate:
+            kind = self.random.choices([name for name, _ in self.ERRORS], [share for _, share in self.ERRORS])[0]
+            self.errors[kind] += 1
+            if kind == 'forbidden':
+                raise Forbidden("Forbidden: bot was blocked by the user")
+            if kind == 'network':
+                raise NetworkError("Connection reset")
+            raise RetryAfter(1)
+        self.sent += 1
+        self.sent_chars += len(text)
+        self.chats.add(chat_id)
+
+def offline_application():
+    # A real Application whose Bot never goes to the network: getMe is answered locally and every
+    # other call succeeds, so initialize() and process_update() work offline
+    from telegram.ext import Application
+    from telegram.request import BaseRequest
+
+    class OfflineRequest(BaseRequest):
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                             connect_timeout=None, pool_timeout=None):
+            if url.endswith('/getMe'):
+                result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+            else:
+                result = True
+            return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    return Application.builder().token('1:bench').request(OfflineRequest()).get_updates_request(OfflineRequest()).build()
@@ -0,0 +1,957 @@
+# Offline benchmark for theBot.py. Needs no network and no Telegram: the saved pages in
+# bench/fixtures are served from a local HTTP server, notifications go to a fake Bot and
+# every run works on a freshly generated database in a temporary directory.
+#
+#   python bench/run_bench.py                          # 10k users, 5k announcements per source
+#   python bench/run_bench.py --users 100000 --json results.json
+#   python bench/run_bench.py --compare results.json   # exits with 1 when a number got worse than --tolerance
+#   python bench/run_bench.py --record                 # refreshes the fixtures from the live pages (needs network)
+#
+# Stages, in run order (most can be skipped or sized with their options, see --help):
+#   parse        HTML parse time per backend
+#   db           single operations, and /latest latency from 1/8/32 threads against the old connection layer
+#   fetch        fetch stage wall time for 1..12 stub sources with latency, one after the other and at once
+#   cycle        first, 304 and changed polls, end-to-end cycle and fan-out rate
+#   commands     /status and /latest p50/p99 on a fake update stream, idle and during a fan-out
+#   resilience   polls against flaky and slow stub hosts with and without retries and circuit breakers
+#   digest       sends per source against one merged message per chat
+#   webhook      updates posted to the webhook server: ingest rate, latency to the handler, status codes
+#   filters      keyword filter matching with 1k..100k filtered users
+#   shards       fan-out rate with 1/2/4 delivery worker processes
+#   scheduler    replay of the adaptive poll schedule against the hourly poll
+#   startup      cold start time against --startup-target, and peak RSS, with and without pandas
+#   history      diff time against 1M stored announcements, seen cache against the old full-history set, insert rate
+#   search       /search latency over a synthetic corpus against a LIKE scan
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+
+try:
+    import resource # Unix only, used for the peak RSS
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCH_DIR, 'fixtures')
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bounbot import (announcements, db, dispatcher, handlers, httpclient, keyword_filters, messages, metrics, parsing, rendering, scheduler,
+                     scraping, search, sharding, sources, users, webhook)
+from fakes import FakeBot, FixtureServer, StubServer, load_fixtures, load_webhook_updates, offline_application
+
+results = {} # Metric name -> {'value': x, 'unit': '...', 'better': 'lower'|'higher'|None (not compared)}
+
+def record(name, value, unit, better='lower'):
+    results[name] = {'value': round(value, 4), 'unit': unit, 'better': better}
+
+def measure(func, repeat) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return times
+
+def p95(values):
+    return sorted(values)[max(0, int(len(values) * 0.95) - 1)]
+
+
+# --- Fixtures ---
+def record_fixtures():
+    import httpx
+    for typ, source in sources.SOURCES.items():
+        response = httpx.get(source['url'], headers=httpclient.headers, verify=False, timeout=httpclient.FETCH_TIMEOUT)
+        response.raise_for_status()
+        response.encoding = 'utf-8'
+        with open(os.path.join(FIXTURE_DIR, f'{typ}.html'), 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"Recorded {typ}: {len(response.content)} bytes, "
+              f"{len(parsing.extract_announcements(response.text, source['selector']))} announcements")
+
+
+# --- Synthetic Database ---
+FIRST_CHAT_ID = 100_000_000
+
+def build_database(path, user_count, announcement_count, pages, subscribed_share=0.8, seed=0):
+    # N users subscribed to each source with `subscribed_share` probability, M old announcements per
+    # source plus the ones currently on the fixture pages (so the first poll finds nothing new)
+    db.db_path = path
+    db.init_db()
+    rng = random.Random(seed)
+    with db.db_lock:
+        with db.get_db() as conn:
+            conn.executemany("INSERT INTO chat_ids (id, first_name, last_name, username) VALUES (?, ?, ?, ?)",
+                             ((FIRST_CHAT_ID + i, f'Kullanıcı {i}', None, f'user{i}') for i in range(user_count)))
+            conn.executemany("INSERT INTO subscriptions (chat_id, source_id) VALUES (?, ?)",
+                             ((FIRST_CHAT_ID + i, source_id) for i in range(user_count)
+                              for source_id in db.source_ids.values() if rng.random() < subscribed_share))
+            for typ, source_id in db.source_ids.items():
+                current = parsing.extract_announcements(pages[typ], sources.SOURCES[typ]['selector'])
+                old = [f"Eski {typ} duyurusu #{i}: {'Sınav programı ' * rng.randint(1, 4)}" for i in range(announcement_count)]
+                conn.executemany("INSERT OR IGNORE INTO announcements (source_id, announcement) VALUES (?, ?)",
+                                 [(source_id, announcement) for announcement in old + list(reversed(current))])
+    users.load_subscription_cache()
+
+
+# --- Stages ---
+def bench_parse(pages, repeat):
+    for backend in parsing.available_backends():
+        for typ, html in pages.items():
+            selector = sources.SOURCES[typ]['selector']
+            times = measure(lambda: parsing.extract_announcements(html, selector, backend), repeat)
+            record(f'parse.{typ}.{backend}', statistics.median(times) * 1000, 'ms')
+
+def bench_db(pages, user_count, repeat):
+    rng = random.Random(1)
+    chat_ids = [FIRST_CHAT_ID + rng.randrange(user_count) for _ in range(repeat * 100)]
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        users.get_user_subscriptions(chat_id)
+    record('db.subscription_lookup', (time.perf_counter() - started) / len(chat_ids) * 1e6, 'us')
+
+    typ = next(iter(sources.SOURCES))
+    times = measure(lambda: (users.unsubscribe(FIRST_CHAT_ID, typ), users.subscribe(FIRST_CHAT_ID, typ)), repeat)
+    record('db.subscribe_write', statistics.median(times) / 2 * 1000, 'ms')
+
+    page = parsing.extract_announcements(pages[typ], sources.SOURCES[typ]['selector'])
+    times = measure(lambda: announcements.find_new_announcements(typ, page), repeat)
+    record('db.diff_warm', statistics.median(times) * 1000, 'ms')
+    def cold_diff():
+        with announcements.seen_cache_lock:
+            announcements.seen_cache.pop(typ, None)
+        announcements.find_new_announcements(typ, page)
+    times = measure(cold_diff, repeat)
+    record('db.diff_cold', statistics.median(times) * 1000, 'ms')
+
+    def cold_latest():
+        rendering.invalidate_rendered(typ)
+        rendering.render_latest(typ, 5)
+    times = measure(cold_latest, repeat)
+    record('db.render_latest_cold', statistics.median(times) * 1000, 'ms')
+
+    stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    times = measure(lambda: messages.save_messages([(FIRST_CHAT_ID, 'merhaba', stamp)]), repeat)
+    record('db.message_insert_single', statistics.median(times) * 1000, 'ms')
+    rows = [(FIRST_CHAT_ID + i, 'merhaba', stamp) for i in range(1000)]
+    times = measure(lambda: messages.save_messages(rows), max(3, repeat // 10))
+    record('db.message_insert_batched', len(rows) / statistics.median(times), 'rows/s', 'higher')
+
+def bench_db_concurrency(db_file, levels, calls):
+    # Latency of the /latest query from `level` handler threads at once while a writer keeps
+    # committing, on the per-thread WAL connections against the old layer: a new sqlite3.connect per
+    # call under one global lock for readers and writers. The file stays in WAL mode for both, so
+    # the old numbers are, if anything, better than the old code really was.
+    statement = "SELECT announcement FROM announcements WHERE source_id = ? ORDER BY id DESC LIMIT ?"
+    source_ids = list(db.source_ids.values())
+    old_lock = threading.Lock()
+
+    def old_read(source_id):
+        with old_lock:
+            conn = sqlite3.connect(db_file)
+            try:
+                return conn.execute(statement, (source_id, 5)).fetchall()
+            finally:
+                conn.close()
+
+    def old_write(rows):
+        with old_lock:
+            conn = sqlite3.connect(db_file)
+            try:
+                conn.executemany("INSERT INTO messages (chat_id, message) VALUES (?, ?)", rows)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def new_read(source_id):
+        return db.get_db().execute(statement, (source_id, 5)).fetchall()
+
+    def new_write(rows):
+        with db.db_lock:
+            with db.get_db() as conn:
+                conn.executemany("INSERT INTO messages (chat_id, message) VALUES (?, ?)", rows)
+
+    for name, read, write in (('old', old_read, old_write), ('new', new_read, new_write)):
+        stopping = threading.Event()
+
+        def writer():
+            rows = [(FIRST_CHAT_ID, 'yük testi') for _ in range(200)]
+            while not stopping.is_set():
+                write(rows)
+                time.sleep(0.002)
+
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        writer_thread.start()
+        try:
+            for level in levels:
+                def handler(index):
+                    times = []
+                    for call in range(calls):
+                        started = time.perf_counter()
+                        read(source_ids[(index + call) % len(source_ids)])
+                        times.append(time.perf_counter() - started)
+                    return times
+
+                with ThreadPoolExecutor(max_workers=level) as pool:
+                    times = [t for thread_times in pool.map(handler, range(level)) for t in thread_times]
+                times.sort()
+                record(f'db.handler_latency_p50.{name}.c{level}', statistics.median(times) * 1000, 'ms', 'lower' if name == 'new' else None)
+                record(f'db.handler_latency_p99.{name}.c{level}', times[int(len(times) * 0.99) - 1] * 1000, 'ms',
+                       'lower' if name == 'new' else None)
+        finally:
+            stopping.set()
+            writer_thread.join()
+    with db.db_lock:
+        with db.get_db() as conn:
+            conn.execute("DELETE FROM messages WHERE message = 'yük testi'")
+    print("Handler DB latency p99 (old -> new): " + ', '.join(
+        f"c{level} {results[f'db.handler_latency_p99.old.c{level}']['value']:.2f} -> "
+        f"{results[f'db.handler_latency_p99.new.c{level}']['value']:.2f} ms" for level in levels))
+
+async def bench_fetch_sources(pages, counts, latency):
+    # Fetch and parse stage of one cycle for 1..N sources, each on its own stub host answering after
+    # `latency` seconds: one source after the other (the old job) against all at once, limited by
+    # FETCH_MAX_WORKERS. The sources are copies of the fixture sources, removed again afterwards.
+    bases = list(sources.SOURCES)
+    servers = [FixtureServer(pages, latency) for _ in range(max(counts))]
+    for server in servers:
+        server.start()
+    keys = [f'bench{i}' for i in range(max(counts))]
+    for i, key in enumerate(keys):
+        base = bases[i % len(bases)]
+        sources.SOURCES[key] = {**sources.SOURCES[base], 'url': servers[i].url(base)}
+    try:
+        for count in counts:
+            for mode in ('sequential', 'concurrent'):
+                scraping.http_cache.clear()
+                started = time.perf_counter()
+                if mode == 'sequential':
+                    results = [await scraping.fetch_announcements(key) for key in keys[:count]]
+                else:
+                    results = await asyncio.gather(*(scraping.fetch_announcements(key) for key in keys[:count]))
+                elapsed = time.perf_counter() - started
+                assert all(results), f"a {mode} fetch of {count} sources failed"
+                record(f'fetch.cycle_time.{mode}.{count}_sources', elapsed * 1000, 'ms')
+        print(f"Fetch stage ({latency * 1000:.0f} ms per page, at most {scraping.FETCH_MAX_WORKERS} at once): " + ', '.join(
+            f"{count} sources {results_ms('sequential', count):.0f} -> {results_ms('concurrent', count):.0f} ms" for count in counts))
+    finally:
+        for key in keys:
+            sources.SOURCES.pop(key, None)
+            scraping.http_cache.pop(key, None)
+            scraping.pending_http_cache.pop(key, None)
+            httpclient.breakers.pop(key, None)
+        await httpclient.close_http_client()
+        for server in servers:
+            server.stop()
+
+def results_ms(mode, count) -> float:
+    return results[f'fetch.cycle_time.{mode}.{count}_sources']['value']
+
+async def bench_cycle(pages, args):
+    server = FixtureServer(pages)
+    server.start()
+    for typ in sources.SOURCES:
+        sources.SOURCES[typ]['url'] = server.url(typ)
+    scraping.http_cache.clear()
+    try:
+        # First poll: full fetch, parse and diff against the DB, nothing new
+        for typ in sources.SOURCES:
+            started = time.perf_counter()
+            outcome = await scheduler.check_source(typ)
+            record(f'cycle.first_poll.{typ}', (time.perf_counter() - started) * 1000, 'ms')
+            assert outcome == 'unchanged', f"first poll of {typ} was {outcome}"
+
+        times = []
+        for typ in sources.SOURCES:
+            started = time.perf_counter()
+            await scheduler.check_source(typ) # Answered with 304
+            times.append(time.perf_counter() - started)
+        record('cycle.not_modified', statistics.median(times) * 1000, 'ms')
+
+        dispatcher.send_bucket = dispatcher.TokenBucket(args.telegram_rate)
+        dispatcher.chat_limiter = dispatcher.PerChatLimiter(args.per_chat_interval)
+        bot = FakeBot(args.send_latency, args.error_rate, args.seed)
+        if args.tracemalloc:
+            tracemalloc.start()
+
+        started = time.perf_counter()
+        for typ in sources.SOURCES:
+            server.publish(typ, [f"Yeni {typ} duyurusu {i} (test)." for i in range(args.new)])
+            poll_started = time.perf_counter()
+            outcome = await scheduler.check_source(typ)
+            record(f'cycle.changed_poll.{typ}', (time.perf_counter() - poll_started) * 1000, 'ms')
+            assert outcome == 'changed', f"poll of {typ} after publishing was {outcome}"
+        queued = db.get_db().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+        drain_started = time.perf_counter()
+        await dispatcher.drain_outbox(bot)
+        drain_elapsed = time.perf_counter() - drain_started
+        record('cycle.end_to_end', time.perf_counter() - started, 's')
+        record('fanout.elapsed', drain_elapsed, 's')
+        record('fanout.rate', (bot.sent + sum(bot.errors.values())) / drain_elapsed, 'msg/s', 'higher')
+        record('fanout.notifications', queued, 'rows', None)
+        if args.tracemalloc:
+            record('memory.cycle_peak_traced', tracemalloc.get_traced_memory()[1] / 1024 / 1024, 'MB')
+            tracemalloc.stop()
+        print(f"Fan-out: {queued} queued, {bot.sent} messages to {len(bot.chats)} chats, errors {dict(bot.errors)}")
+    finally:
+        await httpclient.close_http_client()
+        server.stop()
+
+async def bench_resilience(pages, args):
+    # Polls a flaky source (503 on half the requests), a slow one (never answers within the fetch
+    # timeout) and a healthy one every cycle, once with plain single requests and once with retries
+    # and circuit breakers. Timeouts, the poll interval and the breaker cooldown are scaled down to
+    # seconds to keep the stage short.
+    flaky, slow, healthy = list(sources.SOURCES)[:3]
+    timeout = 1.0
+    interval = 1.5 # Seconds from the start of one cycle to the next
+    servers = {flaky: StubServer(pages[flaky], 'flaky', seed=args.seed),
+               slow: StubServer(pages[slow], 'slow', delay=timeout * 3),
+               healthy: StubServer(pages[healthy], 'healthy')}
+    urls = {typ: sources.SOURCES[typ]['url'] for typ in servers}
+    settings = {name: getattr(httpclient, name) for name in
+                ('FETCH_TIMEOUT', 'FETCH_CONNECT_TIMEOUT', 'FETCH_RETRIES', 'FETCH_RETRY_BASE', 'BREAKER_THRESHOLD', 'BREAKER_COOLDOWN')}
+    modes = {
+        'plain': {'FETCH_RETRIES': 0, 'BREAKER_THRESHOLD': 10 ** 9},
+        'resilient': {'FETCH_RETRIES': settings['FETCH_RETRIES'], 'FETCH_RETRY_BASE': settings['FETCH_RETRY_BASE'] / 20,
+                      'BREAKER_THRESHOLD': settings['BREAKER_THRESHOLD'], 'BREAKER_COOLDOWN': interval * 2},
+    }
+    try:
+        for typ, server in servers.items():
+            sources.SOURCES[typ]['url'] = server.url()
+        for mode, overrides in modes.items():
+            for name, value in {**settings, 'FETCH_TIMEOUT': timeout, 'FETCH_CONNECT_TIMEOUT': timeout, **overrides}.items():
+                setattr(httpclient, name, value)
+            httpclient.breakers.clear()
+            scraping.http_cache.clear()
+            for server in servers.values():
+                server.requests = 0
+            outcomes = Counter()
+            wasted = busy = 0.0
+
+            async def poll(typ):
+                nonlocal wasted
+                started = time.perf_counter()
+                outcome = await scheduler.check_source(typ)
+                outcomes[typ, outcome] += 1
+                if outcome == 'failed':
+                    wasted += time.perf_counter() - started
+
+            for _ in range(args.resilience_cycles):
+                started = time.perf_counter()
+                await asyncio.gather(*(poll(typ) for typ in servers))
+                elapsed = time.perf_counter() - started
+                busy += elapsed
+                await asyncio.sleep(max(0.0, interval - elapsed))
+            await httpclient.close_http_client()
+            record(f'resilience.cycle_time.{mode}', busy / args.resilience_cycles * 1000, 'ms')
+            record(f'resilience.wasted_time.{mode}', wasted, 's')
+            record(f'resilience.flaky_failed_polls.{mode}', outcomes[flaky, 'failed'], 'polls')
+            record(f'resilience.slow_requests.{mode}', servers[slow].requests, 'requests')
+            print(f"Resilience ({mode}): {dict(outcomes)}")
+    finally:
+        for name, value in settings.items():
+            setattr(httpclient, name, value)
+        httpclient.breakers.clear()
+        scraping.http_cache.clear()
+        for typ, url in urls.items():
+            sources.SOURCES[typ]['url'] = url
+        for server in servers.values():
+            server.stop()
+
+async def bench_commands_under_load(args):
+    # A fake update stream of /status and /latest from random users, handled by the real handlers on
+    # the event loop, once idle and once while a fan-out to every subscriber is in flight. Latency
+    # runs from the update's arrival to the handler's return.
+    from types import SimpleNamespace
+    from bounbot import handlers
+    rng = random.Random(args.seed)
+    commands = (('status', handlers.status), ('latest', handlers.latest))
+
+    async def reply_text(text, **kwargs):
+        pass
+
+    async def handle(name, handler, arrived, latencies):
+        chat_id = FIRST_CHAT_ID + rng.randrange(args.users)
+        chat = SimpleNamespace(id=chat_id, first_name='Kullanıcı')
+        update = SimpleNamespace(effective_chat=chat, effective_user=chat, message=SimpleNamespace(reply_text=reply_text))
+        await handler(update, SimpleNamespace(args=[], chat_data={}))
+        latencies[name].append(time.perf_counter() - arrived)
+
+    async def update_stream(latencies, running=None):
+        # Commands arrive every 1 / --command-rate seconds, until `running` is done or --command-count were sent
+        tasks = []
+        interval = 1 / args.command_rate
+        next_arrival = time.perf_counter()
+        while len(tasks) < args.command_count if running is None else not running.done():
+            name, handler = commands[len(tasks) % len(commands)]
+            tasks.append(asyncio.create_task(handle(name, handler, time.perf_counter(), latencies)))
+            next_arrival += interval
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        await asyncio.gather(*tasks)
+
+    def report(mode, latencies):
+        for name, times in latencies.items():
+            times.sort()
+            record(f'commands.{name}_p50.{mode}', statistics.median(times) * 1000, 'ms')
+            record(f'commands.{name}_p99.{mode}', times[max(0, int(len(times) * 0.99) - 1)] * 1000, 'ms')
+
+    idle = {name: [] for name, _ in commands}
+    await update_stream(idle)
+    report('idle', idle)
+
+    dispatcher.send_bucket = dispatcher.TokenBucket(args.telegram_rate)
+    dispatcher.chat_limiter = dispatcher.PerChatLimiter(args.per_chat_interval)
+    for typ in sources.SOURCES:
+        announcements.diff_and_persist(typ, [f"Yük testi {typ} duyurusu {i}." for i in range(args.new)])
+    bot = FakeBot(args.load_send_latency, 0.0, args.seed)
+    loaded = {name: [] for name, _ in commands}
+    started = time.perf_counter()
+    drain = asyncio.create_task(dispatcher.drain_outbox(bot))
+    await update_stream(loaded, drain)
+    await drain
+    record('commands.fanout_elapsed', time.perf_counter() - started, 's', None)
+    report('fanout', loaded)
+    print(f"Commands during a fan-out of {bot.sent} messages: " + ', '.join(
+        f"/{name} p99 {results[f'commands.{name}_p99.idle']['value']:.1f} -> {results[f'commands.{name}_p99.fanout']['value']:.1f} ms "
+        f"({len(loaded[name])} commands)" for name, _ in commands))
+
+async def bench_digest(args):
+    # One cycle with new announcements on every source, delivered one message per source batch
+    # (MERGE_NOTIFICATIONS=0) and merged into one message per chat
+    dispatcher.send_bucket = dispatcher.TokenBucket(args.telegram_rate)
+    try:
+        for merge in (False, True):
+            dispatcher.MERGE_NOTIFICATIONS = merge
+            dispatcher.chat_limiter = dispatcher.PerChatLimiter(args.per_chat_interval)
+            mode = 'merged' if merge else 'per_source'
+            for typ in sources.SOURCES:
+                announcements.diff_and_persist(typ, [f"Özet testi {mode} {typ} {i}." for i in range(args.new)])
+            bot = FakeBot(args.send_latency, 0.0, args.seed)
+            started = time.perf_counter()
+            stats = await dispatcher.drain_outbox(bot)
+            elapsed = time.perf_counter() - started
+            record(f'digest.sends.{mode}', bot.sent, 'msgs')
+            record(f'digest.payloads.{mode}', stats['payloads'], 'groups')
+            record(f'digest.elapsed.{mode}', elapsed, 's')
+            print(f"Delivery {mode}: {bot.sent} messages to {len(bot.chats)} chats, {stats['payloads']} payload groups, {elapsed:.2f}s")
+    finally:
+        dispatcher.MERGE_NOTIFICATIONS = True
+
+async def bench_webhook(updates, connections):
+    # Posts the sample updates to the webhook server over `connections` keep-alive connections. The
+    # server queues them for the same worker pool as in webhook mode, which runs them through
+    # process_update of a real Application to a handler. Latency runs from the POST to the handler.
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    application = offline_application()
+    posted = {} # Update id -> perf_counter when its POST was written
+    latencies = []
+
+    async def handler(update, context):
+        latencies.append(time.perf_counter() - posted[update.update_id])
+    application.add_handler(TypeHandler(Update, handler))
+    await application.initialize()
+
+    queue = asyncio.Queue(maxsize=webhook.WEBHOOK_QUEUE_SIZE)
+    workers = [asyncio.create_task(webhook.process_webhook_updates(application, queue))
+               for _ in range(handlers.COMMAND_CONCURRENCY)]
+    server = await asyncio.start_server(
+        lambda reader, writer: webhook.handle_webhook_connection(application, queue, reader, writer), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    samples = load_webhook_updates()
+    statuses = Counter()
+
+    async def client(first, count):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for update_id in range(first, first + count):
+            body = json.dumps({**samples[update_id % len(samples)], 'update_id': update_id}).encode()
+            posted[update_id] = time.perf_counter()
+            writer.write(f"POST {webhook.WEBHOOK_PATH} HTTP/1.1\r\nHost: bench\r\n"
+                         f"X-Telegram-Bot-Api-Secret-Token: {webhook.WEBHOOK_SECRET}\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            statuses[(await reader.readline()).split()[1].decode()] += 1
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+        writer.close()
+
+    per_connection = updates // connections
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(i * per_connection, per_connection) for i in range(connections)))
+        await queue.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        for worker in workers:
+            worker.cancel()
+        server.close()
+        await server.wait_closed()
+        await application.shutdown()
+    assert set(statuses) == {'200'}, f"webhook statuses: {dict(statuses)}"
+    assert len(latencies) == per_connection * connections, f"{len(latencies)} of {per_connection * connections} updates reached the handler"
+    latencies.sort()
+    record('webhook.ingest_rate', len(latencies) / elapsed, 'updates/s', 'higher')
+    record('webhook.handler_latency_p50', statistics.median(latencies) * 1000, 'ms')
+    record('webhook.handler_latency_p99', latencies[int(len(latencies) * 0.99) - 1] * 1000, 'ms')
+
+def shard_worker(db_file, index, count, args, report):
+    # One delivery worker process: the real worker setup and drain, with a fake Bot
+    logging.getLogger().setLevel(logging.CRITICAL)
+    db.db_path = db_file
+    dispatcher.TELEGRAM_GLOBAL_RATE = args.telegram_rate
+    sharding.setup_worker(index, count)
+    dispatcher.chat_limiter = dispatcher.PerChatLimiter(args.per_chat_interval)
+    bot = FakeBot(args.shard_latency, 0.0, args.seed + index)
+    started = time.time()
+    asyncio.run(dispatcher.drain_outbox(bot, (index, count)))
+    report.put((index, bot.sent, started, time.time()))
+    db.db_executor.shutdown(wait=True)
+
+def bench_shards(db_file, args):
+    # Queues `--shard-messages` notifications and delivers them with 1, 2, 4 ... worker processes.
+    # The rate is taken between the first worker starting its drain and the last one finishing,
+    # so interpreter startup is not counted.
+    context = multiprocessing.get_context('spawn')
+    chat_ids = [FIRST_CHAT_ID + i for i in range(args.shard_messages)]
+    base_rate = None
+    for count in args.shards:
+        with db.db_lock:
+            with db.get_db() as conn:
+                batch_id = conn.execute("INSERT INTO outbox_batches (typ, announcements) VALUES (?, ?)",
+                                        (next(iter(sources.SOURCES)), json.dumps(["Sharding testi duyurusu."]))).lastrowid
+                conn.executemany("INSERT INTO outbox (chat_id, batch_id, next_attempt_at) VALUES (?, ?, 0)",
+                                 ((chat_id, batch_id) for chat_id in chat_ids))
+        report = context.Queue()
+        processes = [context.Process(target=shard_worker, args=(db_file, index, count, args, report)) for index in range(count)]
+        for process in processes:
+            process.start()
+        reports = [report.get() for _ in processes]
+        for process in processes:
+            process.join()
+        sent = sum(sent for _, sent, _, _ in reports)
+        elapsed = max(end for _, _, _, end in reports) - min(start for _, _, start, _ in reports)
+        left = db.get_db().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        assert sent == len(chat_ids) and not left, f"{count} workers sent {sent}/{len(chat_ids)}, {left} left in the outbox"
+        rate = sent / elapsed
+        base_rate = base_rate or rate
+        record(f'shards.rate.{count}', rate, 'msg/s', 'higher')
+        record(f'shards.scaling.{count}', rate / base_rate, 'x', 'higher')
+        print(f"Sharded fan-out: {count} worker(s), {rate:,.0f} msg/s ({rate / base_rate:.2f}x, "
+              f"shares {sorted(sent for _, sent, _, _ in reports)})")
+
+SEARCH_TOPICS = ('yeterlik sınavı', 'burs başvurusu', 'İngilizce kayıt yenileme', 'mezuniyet töreni Güz dönemi',
+                 'kütüphane çalışma saatleri', 'ISTANBUL konferansı', 'yurt ücretleri', 'staj ilanı şartları')
+SEARCH_QUERIES = ('yeterlik sinavi', 'BURS başvuru', 'istanbul', 'mezuniyet töreni güz', 'kutuphane calisma saatleri')
+SEARCH_SYLLABLES = ('ka', 'le', 'mi', 'to', 'ru', 'şe', 'ğı', 'ça', 'bo', 'nü', 'di', 'ye', 'sa', 'tö', 'pa', 'li')
+
+def bench_search(path, corpus, repeat, seed):
+    # FTS5 /search against a LIKE scan over a synthetic corpus of `corpus` announcements
+    db.get_db().close()
+    db.db_local.conn = None # get_db connects to the new db_path
+    db.db_path = path
+    db.init_db()
+    # Announcements are 5-14 words from a 20k word vocabulary, 1% of them mention one of SEARCH_TOPICS
+    rng = random.Random(seed)
+    vocabulary = list({''.join(rng.choices(SEARCH_SYLLABLES, k=rng.randint(2, 4))) for _ in range(20_000)})
+    source_ids = list(db.source_ids.values())
+
+    def corpus_rows():
+        for i in range(corpus):
+            words = rng.choices(vocabulary, k=rng.randint(5, 14))
+            if rng.random() < 0.01:
+                words.insert(rng.randrange(len(words)), rng.choice(SEARCH_TOPICS))
+            yield rng.choice(source_ids), f"{' '.join(words)} #{i}"
+
+    started = time.perf_counter()
+    with db.db_lock:
+        with db.get_db() as conn:
+            conn.executemany("INSERT INTO announcements (source_id, announcement) VALUES (?, ?)", corpus_rows())
+    record('search.build_index', time.perf_counter() - started, 's', None)
+    record('search.db_size', os.path.getsize(path) / 1024 / 1024, 'MB', None)
+
+    fts, like, like_folded, cached = [], [], [], []
+    for query in SEARCH_QUERIES:
+        terms = search.search_terms(query)
+        fts += measure(lambda: search.search_announcements(terms, 1), repeat)
+        rendering.render_cache.clear()
+        search.render_search(query, 1)
+        cached += measure(lambda: search.render_search(query, 1), repeat)
+        # What /search would cost without the index: a scan with one LIKE per word, on the raw and on the folded text
+        conditions = ' AND '.join(['announcement LIKE ?'] * len(terms))
+        statement = f"SELECT id, announcement FROM announcements WHERE {conditions} ORDER BY id DESC LIMIT {search.SEARCH_PAGE_SIZE + 1}"
+        patterns = [f'%{term}%' for term in terms]
+        like += measure(lambda: db.get_db().execute(statement, patterns).fetchall(), max(1, repeat // 10))
+        folded = statement.replace('announcement LIKE', 'turkish_fold(announcement) LIKE')
+        like_folded += measure(lambda: db.get_db().execute(folded, patterns).fetchall(), max(1, repeat // 10))
+    record('search.fts_query', statistics.median(fts) * 1000, 'ms')
+    record('search.fts_query_p95', p95(fts) * 1000, 'ms')
+    record('search.cached_query', statistics.median(cached) * 1e6, 'us')
+    record('search.like_scan', statistics.median(like) * 1000, 'ms')
+    record('search.like_scan_folded', statistics.median(like_folded) * 1000, 'ms')
+    print(f"Search over {corpus:,} announcements: FTS5 {statistics.median(fts) * 1000:.2f} ms, "
+          f"LIKE {statistics.median(like) * 1000:.1f} ms, folded LIKE {statistics.median(like_folded) * 1000:.1f} ms")
+
+def bench_history(path, rows, pages, repeat, seed):
+    # The diff stage of one source with `rows` stored announcements (1M by default): the seen cache with
+    # an indexed lookup for its misses, cold and warm, against the old SELECT of the whole history into a
+    # set on every poll. The page is the fixture page with 5 new announcements on top.
+    db.get_db().close()
+    db.db_local.conn = None # get_db connects to the new db_path
+    db.db_path = path
+    db.init_db()
+    typ = next(iter(sources.SOURCES))
+    source_id = db.source_ids[typ]
+    page = parsing.extract_announcements(pages[typ], sources.SOURCES[typ]['selector'])
+    rng = random.Random(seed)
+    titles = [' '.join(''.join(rng.choices(SEARCH_SYLLABLES, k=3)) for _ in range(10)) for _ in range(1_000)]
+
+    def history_rows():
+        for i in range(rows): # Numbered, so the unique index is filled in order
+            yield source_id, f"Duyuru {i:07d}: {titles[i % len(titles)]}"
+        for announcement in reversed(page): # The page is already stored, newest last
+            yield source_id, announcement.strip()
+
+    started = time.perf_counter()
+    with db.db_lock:
+        with db.get_db() as conn:
+            conn.execute("DROP TRIGGER announcements_fts_insert") # Not needed here, indexing would take most of the time
+            conn.executemany("INSERT OR IGNORE INTO announcements (source_id, announcement) VALUES (?, ?)", history_rows())
+            db.create_search_index(conn.cursor()) # Back for the insert rate below
+    record('history.build', time.perf_counter() - started, 's', None)
+
+    fresh = [f"Yeni duyuru {i} (test)." for i in range(5, 0, -1)]
+    polled = list(dict.fromkeys(ann.strip() for ann in fresh + page if ann.strip()))
+
+    def old_diff():
+        c = db.get_db().execute("SELECT announcement FROM announcements WHERE source_id = ?", (source_id,))
+        existing = {row[0].strip() for row in c.fetchall()}
+        return [ann for ann in polled if ann not in existing]
+
+    def cold_diff():
+        with announcements.seen_cache_lock:
+            announcements.seen_cache.pop(typ, None)
+        return announcements.find_new_announcements(typ, polled)
+
+    assert old_diff() == cold_diff() == fresh, "old and new diff disagree"
+    old = measure(old_diff, max(3, repeat // 10))
+    cold = measure(cold_diff, repeat)
+    warm = measure(lambda: announcements.find_new_announcements(typ, polled), repeat)
+    record('history.diff_old', statistics.median(old) * 1000, 'ms')
+    record('history.diff_cold', statistics.median(cold) * 1000, 'ms')
+    record('history.diff_warm', statistics.median(warm) * 1000, 'ms')
+    print(f"Diff against {rows:,} stored announcements: full-history set {statistics.median(old) * 1000:.0f} ms, "
+          f"seen cache cold {statistics.median(cold) * 1000:.2f} ms, warm {statistics.median(warm) * 1000:.2f} ms")
+
+    # Storing a large page of new announcements on top of the history (one executemany, one transaction)
+    batch = [f"Toplu duyuru {i} (test)." for i in range(20_000, 0, -1)]
+    started = time.perf_counter()
+    announcements.persist_announcements(typ, batch)
+    record('history.insert_rate', len(batch) / (time.perf_counter() - started), 'rows/s', 'higher')
+
+def bench_filters(user_counts, repeat, seed):
+    # Keyword filter matching with 1k..100k filtered users: the compiled matcher against looping over
+    # every user's keywords. Users pick 1-3 include and 0-1 exclude keywords from a 5k word vocabulary.
+    rng = random.Random(seed)
+    vocabulary = sorted({''.join(rng.choices(SEARCH_SYLLABLES, k=rng.randint(2, 4))) for _ in range(5_000)})
+    texts = [' '.join(rng.choices(vocabulary, k=rng.randint(8, 16))) for _ in range(50)]
+    typ = next(iter(sources.SOURCES))
+    saved = keyword_filters.filter_index[typ]
+    try:
+        for count in user_counts:
+            source_filters = keyword_filters.SourceFilters()
+            for chat_id in range(FIRST_CHAT_ID, FIRST_CHAT_ID + count):
+                for keyword in rng.sample(vocabulary, rng.randint(1, 3)):
+                    source_filters.add(chat_id, keyword, False)
+                if rng.random() < 0.5:
+                    source_filters.add(chat_id, rng.choice(vocabulary), True)
+            keyword_filters.filter_index[typ] = source_filters
+            chat_ids = list(source_filters.chats)
+            started = time.perf_counter()
+            source_filters.matcher()
+            record(f'filters.compile.{count}', (time.perf_counter() - started) * 1000, 'ms')
+
+            times = measure(lambda: [source_filters.match(text) for text in texts], max(1, repeat // 5))
+            record(f'filters.match.{count}', statistics.median(times) / len(texts) * 1e6, 'us')
+            times = measure(lambda: keyword_filters.route_filtered(typ, texts[:3], chat_ids), max(1, repeat // 10))
+            record(f'filters.route.{count}', statistics.median(times) * 1000, 'ms')
+
+            def naive():
+                for text in texts[:3]:
+                    words = keyword_filters.normalize_keyword(text).split()
+                    for keywords in source_filters.chats.values():
+                        for keyword in keywords:
+                            any(word.startswith(keyword) for word in words)
+            times = measure(naive, 1)
+            record(f'filters.naive.{count}', statistics.median(times) * 1000, 'ms')
+            print(f"Filters, {count:,} users: match {results[f'filters.match.{count}']['value']:.1f} us/announcement, "
+                  f"route 3 announcements {results[f'filters.route.{count}']['value']:.1f} ms, "
+                  f"per-user loop {results[f'filters.naive.{count}']['value']:.1f} ms")
+    finally:
+        keyword_filters.filter_index[typ] = saved
+
+def load_change_log(path) -> list[datetime]:
+    # One ISO 8601 timestamp per line (university time when it has no offset), e.g. when each
+    # announcement was first seen
+    changes = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                stamp = datetime.fromisoformat(line.strip())
+                changes.append(stamp if stamp.tzinfo else stamp.replace(tzinfo=scheduler.UNIVERSITY_TZ))
+    return sorted(changes)
+
+SYNTHETIC_START = datetime(2025, 3, 3, tzinfo=scheduler.UNIVERSITY_TZ) # A Monday
+
+def synthetic_changes(days, changes_per_day, seed) -> list[datetime]:
+    # Announcements published at random times during working hours on weekdays
+    rng = random.Random(seed)
+    start = SYNTHETIC_START
+    changes = []
+    for day in range(days):
+        date = start + timedelta(days=day)
+        if date.weekday() < 5:
+            for _ in range(changes_per_day):
+                changes.append(date + timedelta(hours=rng.uniform(scheduler.WORKING_HOURS.start, scheduler.WORKING_HOURS.stop)))
+    return sorted(changes)
+
+def replay_schedule(changes, start, end, next_delay) -> tuple[int, list[float]]:
+    # Polls from `start` to `end`, `next_delay(state, outcome, now)` seconds apart. Returns the
+    # number of polls and the detection delay of every change in minutes.
+    now, state, polls, delays, pending = start, {}, 0, [], 0
+    while now < end:
+        polls += 1
+        detected = []
+        while pending < len(changes) and changes[pending] <= now:
+            detected.append(changes[pending])
+            pending += 1
+        delays += [(now - change).total_seconds() / 60 for change in detected]
+        now += timedelta(seconds=next_delay(state, 'changed' if detected else 'unchanged', now))
+    return polls, delays
+
+def bench_scheduler(days, changes_per_day, seed, change_log=None):
+    # Replays next_poll_interval against the change timestamps of one source and compares it with
+    # the hourly poll it replaced, on the same timestamps
+    random.seed(seed) # next_poll_interval draws its jitter from the global generator
+    if change_log:
+        changes = load_change_log(change_log)
+        origin = f"{len(changes)} changes from {change_log}"
+        start = changes[0].replace(hour=0, minute=0, second=0, microsecond=0)
+        end = changes[-1].replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        days = (end - start) / timedelta(days=1)
+    else:
+        changes = synthetic_changes(days, changes_per_day, seed)
+        origin = f"{len(changes)} synthetic changes ({changes_per_day} per weekday)"
+        start, end = SYNTHETIC_START, SYNTHETIC_START + timedelta(days=days)
+    for name, next_delay in (('hourly', lambda state, outcome, now: 3600), ('adaptive', scheduler.next_poll_interval)):
+        polls, delays = replay_schedule(changes, start, end, next_delay)
+        record(f'scheduler.polls_per_day.{name}', polls / days, 'polls', 'lower' if name == 'adaptive' else None)
+        record(f'scheduler.detection_delay_mean.{name}', statistics.mean(delays), 'min', 'lower' if name == 'adaptive' else None)
+        record(f'scheduler.detection_delay_p95.{name}', p95(delays), 'min', 'lower' if name == 'adaptive' else None)
+        print(f"Scheduler ({name}, {origin}): {polls / days:.1f} polls/day, "
+              f"detection delay mean {statistics.mean(delays):.1f} min, p95 {p95(delays):.1f} min")
+
+
+# Run in the startup subprocesses after prepare_application: one fan-out's subscriber lookup for every
+# source, then the peak RSS. The pandas variant does the lookup the way theBot.py did before
+# iter_subscriber_ids, through a DataFrame of the whole user table, and imports pandas first like it did.
+SUBSCRIBERS_SCRIPT = """
+from bounbot import users
+from bounbot.sources import SOURCES
+for typ in SOURCES:
+    sum(len(chunk) for chunk in users.iter_subscriber_ids(typ))
+"""
+PANDAS_SUBSCRIBERS_SCRIPT = """
+from bounbot.db import get_db, source_ids
+from bounbot.sources import SOURCES
+for typ in SOURCES:
+    frame = pd.DataFrame(get_db().execute("SELECT chat_id, source_id FROM subscriptions").fetchall(), columns=['id', 'source_id'])
+    len(frame[frame['source_id'] == source_ids[typ]]['id'].tolist())
+"""
+PEAK_RSS_SCRIPT = """
+import resource, sys
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(peak / 1024 if sys.platform != 'darwin' else peak / 1024 / 1024)
+"""
+
+def bench_startup(db_file, repeat=3) -> float:
+    # Cold starts in fresh interpreters: `theBot.py --check`, and everything the bot does before its
+    # first network call (prepare_application), i.e. the time until polling starts. With pandas
+    # installed, the same start with pandas imported as before, and the peak RSS of both after one
+    # subscriber lookup per source.
+    repo = os.path.dirname(BENCH_DIR)
+    env = dict(os.environ, DB_PATH=db_file, TELEGRAM_BOT_TOKEN='123456:' + 'x' * 35, NOTIFIER='none', PYTHONDONTWRITEBYTECODE='1')
+    ready = "from bounbot.app import prepare_application; prepare_application('123456:bench')\n"
+    commands = {
+        'startup.check': [sys.executable, os.path.join(repo, 'theBot.py'), '--check'],
+        'startup.ready_to_poll': [sys.executable, '-c', ready + SUBSCRIBERS_SCRIPT + (PEAK_RSS_SCRIPT if resource else '')],
+    }
+    if find_spec('pandas'):
+        commands['startup.ready_to_poll.pandas'] = [sys.executable, '-c', "import pandas as pd\n" + ready + PANDAS_SUBSCRIBERS_SCRIPT +
+                                                    (PEAK_RSS_SCRIPT if resource else '')]
+    else:
+        print("pandas is not installed, skipping the startup comparison with it.")
+    for name, command in commands.items():
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = subprocess.run(command, cwd=repo, env=env, capture_output=True, check=True, text=True).stdout
+            times.append(time.perf_counter() - started)
+        record(name, statistics.median(times), 's')
+        if name != 'startup.check' and resource:
+            record(name.replace('ready_to_poll', 'peak_rss'), float(output.split()[-1]), 'MB')
+    if 'startup.ready_to_poll.pandas' in results:
+        print(f"Start until polling: {results['startup.ready_to_poll']['value']:.2f}s, "
+              f"{results['startup.ready_to_poll.pandas']['value']:.2f}s with pandas"
+              + (f"; peak RSS {results['startup.peak_rss']['value']:.0f} MB, "
+                 f"{results['startup.peak_rss.pandas']['value']:.0f} MB with pandas" if resource else ''))
+    return results['startup.ready_to_poll']['value']
+
+
+# --- Report ---
+def print_results():
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        print(f"{name:<{width}}  {result['value']:>14,.3f}  {result['unit']}")
+
+def compare(baseline_path, tolerance, config) -> int:
+    with open(baseline_path, encoding='utf-8') as f:
+        saved = json.load(f)
+    baseline = saved['metrics']
+    differences = {key: (value, config.get(key)) for key, value in saved.get('config', {}).items() if config.get(key) != value}
+    if differences:
+        print(f"Warning: the baseline ran with different settings: {differences}")
+    regressions = 0
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before['value'] or not result['better']:
+            continue
+        change = result['value'] / before['value'] - 1
+        worse = change > tolerance if result['better'] == 'lower' else change < -tolerance
+        if worse:
+            regressions += 1
+            print(f"REGRESSION {name}: {before['value']} -> {result['value']} {result['unit']} ({change:+.0%})")
+    print(f"{regressions} regression(s) against {baseline_path} (tolerance {tolerance:.0%}).")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the BOUN announcements bot")
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--announcements', type=int, default=5_000, help="old announcements per source")
+    parser.add_argument('--new', type=int, default=3, help="announcements published per source in the cycle")
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--send-latency', type=float, default=0.0, help="fake Bot seconds per send_message")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of sends the fake Bot fails")
+    parser.add_argument('--telegram-rate', type=float, default=1e6, help="global send limit, 30 is Telegram's")
+    parser.add_argument('--per-chat-interval', type=float, default=0.0)
+    parser.add_argument('--shards', type=lambda value: [int(count) for count in value.split(',') if count], default=[1, 2, 4],
+                        help="delivery worker counts to compare, e.g. 1,2,4 ('' skips the stage)")
+    parser.add_argument('--shard-messages', type=int, default=2_000, help="notifications delivered per worker count")
+    parser.add_argument('--shard-latency', type=float, default=0.05, help="fake Bot seconds per send_message in the sharding stage")
+    parser.add_argument('--history-rows', type=int, default=1_000_000, help="stored announcements in the history diff stage, 0 skips it")
+    parser.add_argument('--search-corpus', type=int, default=200_000,
+                        help="announcements in the search benchmark (1000000 for the full size), 0 skips it")
+    parser.add_argument('--filter-users', type=lambda value: [int(count) for count in value.split(',') if count],
+                        default=[1_000, 10_000, 100_000], help="filtered user counts to compare ('' skips the stage)")
+    parser.add_argument('--command-rate', type=float, default=50, help="commands per second in the command latency stage")
+    parser.add_argument('--command-count', type=int, default=500, help="commands measured while idle, 0 skips the stage")
+    parser.add_argument('--load-send-latency', type=float, default=0.02, help="fake Bot seconds per send_message during the command stage")
+    parser.add_argument('--db-concurrency', type=lambda value: [int(level) for level in value.split(',') if level], default=[1, 8, 32],
+                        help="handler threads for the DB latency stage ('' skips it)")
+    parser.add_argument('--fetch-sources', type=lambda value: [int(count) for count in value.split(',') if count], default=[1, 3, 6, 12],
+                        help="source counts for the fetch stage ('' skips it)")
+    parser.add_argument('--fetch-latency', type=float, default=0.2, help="stub server seconds per page in the fetch stage")
+    parser.add_argument('--resilience-cycles', type=int, default=20, help="poll cycles against the flaky and slow stub hosts, 0 skips them")
+    parser.add_argument('--webhook-updates', type=int, default=5_000, help="updates posted to the webhook server")
+    parser.add_argument('--days', type=int, default=28, help="simulated days for the scheduler replay")
+    parser.add_argument('--changes-per-day', type=int, default=3)
+    parser.add_argument('--change-log', help="file with one ISO timestamp per line to replay instead of synthetic changes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup-target', type=float, default=1.5, help="seconds allowed until polling could start")
+    parser.add_argument('--tracemalloc', action='store_true', help="trace Python allocations during the cycle (slower)")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results file of an earlier run to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--record', action='store_true', help="download the live pages into bench/fixtures and exit")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    if args.record:
+        record_fixtures()
+        return 0
+
+    pages = load_fixtures()
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        build_database(os.path.join(tmp, 'bench.db'), args.users, args.announcements, pages, seed=args.seed)
+        record('setup.build_database', time.perf_counter() - started, 's')
+
+        bench_parse(pages, args.repeat)
+        bench_db(pages, args.users, args.repeat)
+        if args.db_concurrency:
+            bench_db_concurrency(os.path.join(tmp, 'bench.db'), args.db_concurrency, args.repeat * 4)
+
+        async def run_async():
+            if args.fetch_sources:
+                await bench_fetch_sources(pages, args.fetch_sources, args.fetch_latency)
+            await bench_cycle(pages, args)
+            if args.command_count:
+                await bench_commands_under_load(args)
+            if args.resilience_cycles:
+                await bench_resilience(pages, args)
+            await bench_digest(args)
+            await bench_webhook(args.webhook_updates, connections=8)
+        asyncio.run(run_async())
+        if args.filter_users:
+            bench_filters(args.filter_users, args.repeat, args.seed)
+        if args.shards:
+            bench_shards(os.path.join(tmp, 'bench.db'), args)
+        bench_scheduler(args.days, args.changes_per_day, args.seed, args.change_log)
+        startup = bench_startup(os.path.join(tmp, 'bench.db'))
+        if args.history_rows:
+            bench_history(os.path.join(tmp, 'history.db'), args.history_rows, pages, args.repeat, args.seed)
+        if args.search_corpus:
+            bench_search(os.path.join(tmp, 'search.db'), args.search_corpus, args.repeat, args.seed)
+
+        _, histograms = metrics.metrics.snapshot()
+        lock_wait = histograms.get(('bot_lock_wait_seconds', (('lock', 'db'),)))
+        if lock_wait:
+            record('db.lock_wait_max', lock_wait['max'] * 1000, 'ms')
+        if resource:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            record('memory.peak_rss', peak / 1024 if sys.platform != 'darwin' else peak / 1024 / 1024, 'MB')
+        db.db_executor.shutdown(wait=True)
+
+    print_results()
+    config = {key: value for key, value in vars(args).items() if key not in ('json', 'compare', 'verbose', 'record')}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'metrics': results}, f, indent=2)
+    status = 0
+    if startup > args.startup_target:
+        print(f"Cold start took {startup:.2f}s, over the {args.startup_target:.2f}s target.")
+        status = 1
+    if args.compare:
+        status = compare(args.compare, args.tolerance, config) or status
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,12 @@
+# The BOUN announcements bot. theBot.py is the entry point, the modules are imported on demand
+# so that `python theBot.py --check` and the benchmarks don't pay for the Telegram stack.
+import os
+
+try:
+    from dotenv import load_dotenv
+except ImportError: # Reported by --check, the settings can still come from the environment
+    load_dotenv = None
+
+if load_dotenv:
+    load_dotenv() # Before any module reads its settings from the environment
+os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .db import db_lock, delete_finished_batches, get_db, source_ids
+from .keyword_filters import filtered_chats, route_filtered
+from .metrics import metrics
+from .rendering import invalidate_rendered
+from .users import digest_due_times, digest_modes, iter_subscriber_ids, subscribed_among
+
+logger = logging.getLogger(__name__)
+
+# --- Seen Cache ---
+# Bounded per-source cache of recently seen announcement fingerprints. A page only lists the
+# latest announcements, so a warm cache answers almost every lookup; misses fall back to an
+# indexed point lookup instead of reading the whole history.
+SEEN_CACHE_SIZE = int(os.getenv('SEEN_CACHE_SIZE', 1000))
+seen_cache = {} # Source key -> OrderedDict of fingerprints, oldest first
+seen_cache_lock = threading.Lock()
+
+def fingerprint(announcement: str) -> bytes:
+    return hashlib.blake2b(announcement.encode('utf-8'), digest_size=16).digest()
+
+def remember_announcements(typ, announcements):
+    with seen_cache_lock:
+        cache = seen_cache.setdefault(typ, OrderedDict())
+        for announcement in announcements:
+            key = fingerprint(announcement)
+            cache[key] = None
+            cache.move_to_end(key)
+        while len(cache) > SEEN_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def warm_seen_cache(typ):
+    try:
+        c = get_db().cursor()
+        c.execute("SELECT announcement FROM announcements WHERE source_id = ? ORDER BY id DESC LIMIT ?", (source_ids[typ], SEEN_CACHE_SIZE))
+        remember_announcements(typ, reversed([row[0].strip() for row in c.fetchall()]))
+    except sqlite3.Error as e:
+        logger.error(f"Database error warming the {typ.upper()} seen cache: {e}")
+
+def find_new_announcements(typ, announcements: list[str]) -> list[str]:
+    # The announcements that are not stored yet, in the given order
+    if typ not in seen_cache:
+        warm_seen_cache(typ)
+    with seen_cache_lock:
+        cache = seen_cache.get(typ, {})
+        misses = [ann for ann in announcements if fingerprint(ann) not in cache]
+    if not misses:
+        return []
+    try:
+        c = get_db().cursor()
+        c.execute(f"SELECT announcement FROM announcements WHERE source_id = ? AND announcement IN ({', '.join('?' * len(misses))})",
+                  (source_ids[typ], *misses))
+        stored = {row[0] for row in c.fetchall()}
+    except sqlite3.Error as e:
+        logger.error(f"Database error looking up {typ.upper()} announcements: {e}")
+        raise
+    remember_announcements(typ, stored)
+    return [ann for ann in misses if ann not in stored]
+
+def persist_announcements(typ, ordered_announcements: list[str], recipient_chunks=(), filtered_groups=()) -> list[tuple[int, str]]:
+    # Stores the new announcements with one executemany and queues their notifications in the
+    # same transaction, so an announcement is never marked as seen without its notifications.
+    # `recipient_chunks` get every announcement, `filtered_groups` are (announcements, chat ids)
+    # pairs from keyword_filters.route_filtered. Returns (id, announcement) pairs in the given
+    # (site) order. Raises sqlite3.Error on failure.
+    source_id = source_ids[typ]
+    with db_lock:
+        with get_db() as conn:
+            c = conn.cursor()
+            # The site lists the newest first, the oldest one gets the lowest id
+            c.executemany("INSERT OR IGNORE INTO announcements (source_id, announcement) VALUES (?, ?)",
+                          [(source_id, announcement) for announcement in reversed(ordered_announcements)])
+            saved_count = c.rowcount
+            c.execute(f"SELECT announcement, id FROM announcements WHERE source_id = ? AND announcement IN ({', '.join('?' * len(ordered_announcements))})",
+                      (source_id, *ordered_announcements))
+            ids = dict(c.fetchall())
+            saved = [(ids[announcement], announcement) for announcement in ordered_announcements]
+
+            queued_count = 0
+            batch_id = None
+            now = time.time()
+            due = digest_due_times(now) # Digest chats get theirs at the end of their window
+            for chunk in recipient_chunks:
+                if batch_id is None:
+                    c.execute("INSERT INTO outbox_batches (typ, announcements, first_id, last_id) VALUES (?, ?, ?, ?)",
+                              (typ, json.dumps(ordered_announcements, ensure_ascii=False), min(ids.values()), max(ids.values())))
+                    batch_id = c.lastrowid
+                c.executemany("INSERT INTO outbox (chat_id, batch_id, next_attempt_at) VALUES (?, ?, ?)",
+                              [(chat_id, batch_id, due[digest_modes.get(chat_id, 'instant')]) for chat_id in chunk])
+                queued_count += len(chunk)
+            for group_announcements, chat_ids in filtered_groups:
+                # No id range: the range is the key of the unfiltered payload in the render cache
+                c.execute("INSERT INTO outbox_batches (typ, announcements) VALUES (?, ?)",
+                          (typ, json.dumps(group_announcements, ensure_ascii=False)))
+                group_batch_id = c.lastrowid
+                c.executemany("INSERT INTO outbox (chat_id, batch_id, next_attempt_at) VALUES (?, ?, ?)",
+                              [(chat_id, group_batch_id, due[digest_modes.get(chat_id, 'instant')]) for chat_id in chat_ids])
+                queued_count += len(chat_ids)
+            if queued_count:
+                logger.info(f"Queued {queued_count} {typ.upper()} notifications in the outbox.")
+            else:
+                logger.info(f"No users subscribed for {typ.upper()} notifications.")
+            conn.commit()
+    logger.info(f"Saved {saved_count} new {typ} announcements to DB.")
+    return saved
+
+
+### --- Outbox Functions ---
+def get_due_outbox(limit: int, shard: tuple[int, int] = None) -> list[tuple]:
+    # The due notifications of the chats owning the `limit` oldest due ones, oldest first. A chat's
+    # due rows always come together, so the drain can merge them into one message. With a
+    # shard (index, count) only the chats of that delivery worker (see sharding.shard_of).
+    index, count = shard or (0, 1)
+    now = time.time()
+    try:
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("""
+                SELECT o.id, o.chat_id, o.attempts, o.parts_sent, b.id, b.typ, b.announcements, b.first_id, b.last_id
+                FROM outbox o JOIN outbox_batches b ON b.id = o.batch_id
+                WHERE o.chat_id IN (SELECT chat_id FROM outbox
+                                    WHERE next_attempt_at <= ? AND ABS(chat_id) % ? = ?
+                                    ORDER BY next_attempt_at, id LIMIT ?)
+                    AND o.next_attempt_at <= ?
+                ORDER BY o.next_attempt_at, o.id
+            """, (now, count, index, limit, now))
+            return c.fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading the outbox: {e}")
+        return []
+
+def finish_outbox(done_ids: list[int], retry_rows: list[tuple], batch_ids: set):
+    # Removes delivered (or given up) notifications and reschedules `retry_rows` (id, attempts, next_attempt_at, parts_sent).
+    # `batch_ids` are the batches of the removed rows; the ones no row points to anymore are deleted.
+    # Raises sqlite3.Error, the caller must not read the outbox again before this went through.
+    with db_lock:
+        with get_db() as conn:
+            c = conn.cursor()
+            c.executemany("DELETE FROM outbox WHERE id = ?", ((outbox_id,) for outbox_id in done_ids))
+            c.executemany("UPDATE outbox SET attempts = ?, next_attempt_at = ?, parts_sent = ? WHERE id = ?",
+                          ((attempts, next_attempt_at, parts_sent, outbox_id)
+                           for outbox_id, attempts, next_attempt_at, parts_sent in retry_rows))
+            delete_finished_batches(c, batch_ids)
+            conn.commit()
+
+
+# --- Diff Stage ---
+def diff_and_persist(typ, current: list[str]) -> list[tuple[int, str]]:
+    # The single diff stage of a poll: normalizes and dedupes the scraped page keeping the site's
+    # order, stores what is new and queues it for the subscribers. Returns the new (id, announcement)
+    # pairs in site order. Raises sqlite3.Error when the page could not be diffed or saved.
+    page = list(dict.fromkeys(ann.strip() for ann in current if ann.strip()))
+    with metrics.timer('bot_phase_seconds', phase='diff', source=typ):
+        new_announcements_ordered = find_new_announcements(typ, page)
+    if not new_announcements_ordered:
+        logger.info(f"No new {typ.upper()} announcements found.")
+        return []
+
+    logger.info(f"Found {len(new_announcements_ordered)} new {typ.upper()} announcement(s) in order.")
+    metrics.inc('bot_new_announcements_total', len(new_announcements_ordered), source=typ)
+    # Chats with keyword filters only get the announcements their filters let through
+    filtered = filtered_chats(typ)
+    with metrics.timer('bot_phase_seconds', phase='filter', source=typ):
+        groups = route_filtered(typ, new_announcements_ordered, subscribed_among(typ, filtered)) if filtered else []
+    # Delivery happens in drain_outbox_job, independent of the scraping cycle
+    with metrics.timer('bot_phase_seconds', phase='persist', source=typ):
+        saved = persist_announcements(typ, new_announcements_ordered, recipient_chunks=iter_subscriber_ids(typ, skip=filtered),
+                                      filtered_groups=groups)
+    remember_announcements(typ, new_announcements_ordered)
+    invalidate_rendered(typ)
+    return saved
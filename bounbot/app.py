@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import logging
+import os
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# --- Main Function ---
+# Only the standard library is imported up front. The Telegram stack, httpx and the parsers are
+# pulled in by prepare_application, so `--check` starts in a fraction of the time.
+def configure_logging():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+async def on_startup(application):
+    from .monitoring import start_metrics_server
+    from .notifier import notify
+    from .sharding import worker_pool
+    await start_metrics_server()
+    if worker_pool:
+        worker_pool.start()
+    notify("The Bot has just started!")
+    logger.info("Bot started successfully.")
+
+async def on_shutdown(application):
+    from .db import db_executor
+    from .httpclient import close_http_client
+    from .messages import message_buffer
+    from .monitoring import stop_metrics_server
+    from .sharding import worker_pool
+    if worker_pool:
+        worker_pool.stop()
+    await message_buffer.flush()
+    await stop_metrics_server()
+    await close_http_client()
+    db_executor.shutdown(wait=True)
+
+def prepare_application(token):
+    # Everything up to the first network call: DB, caches, handlers and jobs
+    from telegram.ext import Application, CommandHandler, MessageHandler, filters
+    from .db import init_db
+    from .dispatcher import SEND_CONCURRENCY
+    from .handlers import (COMMAND_CONCURRENCY, digest_command, filter_command, handle_message, latest, metrics_command, more,
+                           profile_command, search, start, status, stop, subscribe_to_source, unfilter_command,
+                           unsubscribe_from_source)
+    from .keyword_filters import load_filters
+    from .scheduler import schedule_jobs
+    from .sources import SOURCES
+    from .users import load_subscription_cache
+
+    init_db()
+    load_subscription_cache()
+    load_filters()
+
+    # Polling, handlers, scraping and notifications all run on one event loop. Commands are
+    # handled concurrently and the bot's connection pool leaves room for a running fan-out.
+    application = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(COMMAND_CONCURRENCY)
+        .connection_pool_size(SEND_CONCURRENCY + COMMAND_CONCURRENCY)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("status", status))
+    application.add_handler(CommandHandler("latest", latest))
+    application.add_handler(CommandHandler("stop", stop))
+    application.add_handler(CommandHandler("search", search))
+    application.add_handler(CommandHandler("more", more))
+    application.add_handler(CommandHandler("filter", filter_command))
+    application.add_handler(CommandHandler("unfilter", unfilter_command))
+    application.add_handler(CommandHandler("digest", digest_command))
+    application.add_handler(CommandHandler("metrics", metrics_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+
+    for typ in SOURCES:
+        application.add_handler(CommandHandler(f"subscribe_{typ}", partial(subscribe_to_source, typ=typ)))
+        application.add_handler(CommandHandler(f"unsubscribe_{typ}", partial(unsubscribe_from_source, typ=typ)))
+
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    logger.info("Command handlers registered.")
+
+    schedule_jobs(application.job_queue)
+    return application
+
+def run_bot() -> int:
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        logger.critical("TELEGRAM_BOT_TOKEN environment variable not set!")
+        return 1
+
+    # A second instance would scrape and notify everything twice
+    from .sharding import LeaderLock, lock_path
+    leader_lock = LeaderLock(lock_path())
+    if not leader_lock.acquire():
+        logger.critical(f"Another instance (pid {leader_lock.holder()}) holds {leader_lock.path}, exiting.")
+        return 1
+
+    application = prepare_application(token)
+
+    from .check import WEBHOOK_SECRET_PATTERN
+    from .webhook import WEBHOOK_SECRET, WEBHOOK_URL, run_webhook
+    if WEBHOOK_URL:
+        if not WEBHOOK_SECRET_PATTERN.match(WEBHOOK_SECRET):
+            logger.critical("WEBHOOK_SECRET may only contain A-Z, a-z, 0-9, _ and - (1-256 characters), exiting.")
+            leader_lock.release()
+            return 1
+        logger.info("Starting bot in webhook mode...")
+        try:
+            asyncio.run(run_webhook(application))
+        except KeyboardInterrupt:
+            pass
+    else:
+        logger.info("Starting bot polling...")
+        application.run_polling()
+    leader_lock.release()
+    logger.info("Bot stopped.")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Boğaziçi University announcements Telegram bot")
+    parser.add_argument('--check', action='store_true', help="validate the configuration and the database, then exit")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    if args.check:
+        from .check import run_check
+        return run_check()
+    return run_bot()
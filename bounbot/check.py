@@ -0,0 +1,127 @@
+import os
+import re
+import sqlite3
+import sys
+from importlib.util import find_spec
+from pathlib import Path
+
+from . import db
+from .notifier import NOTIFIER, NOTIFIERS
+from .parsing import EXTRACTORS, HTML_BACKEND, available_backends
+from .sharding import DELIVERY_WORKERS, LeaderLock, lock_path
+from .sources import SOURCES
+
+# --- Startup Check ---
+# `python theBot.py --check` validates the configuration and the database and exits with 1 on errors.
+# It never imports the Telegram stack, goes to the network or writes to the database.
+TOKEN_PATTERN = re.compile(r'^\d+:[\w-]{30,}$')
+WEBHOOK_SECRET_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,256}$') # What Telegram accepts, also checked by app.run_bot in webhook mode
+# Module -> package to install. Looked up without importing them.
+REQUIRED_PACKAGES = {
+    'telegram': 'python-telegram-bot[job-queue]==21.*',
+    'apscheduler': 'python-telegram-bot[job-queue]==21.*',
+    'httpx': 'httpx',
+    'bs4': 'beautifulsoup4',
+    'dotenv': 'python-dotenv',
+}
+
+def check_packages(errors: list, warnings: list):
+    missing = {}
+    for module, package in REQUIRED_PACKAGES.items():
+        if not find_spec(module):
+            missing.setdefault(package, []).append(module)
+    for package, modules in missing.items():
+        errors.append(f"{', '.join(modules)} not installed (pip install \"{package}\").")
+    if NOTIFIER in ('toast', 'auto') and sys.platform == 'win32' and not find_spec('win10toast'):
+        warnings.append("win10toast is not installed, desktop notifications go to the log.")
+
+def check_config(errors: list, warnings: list):
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        errors.append("TELEGRAM_BOT_TOKEN is not set.")
+    elif not TOKEN_PATTERN.match(token):
+        errors.append("TELEGRAM_BOT_TOKEN does not look like a bot token (<id>:<secret>).")
+
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if webhook_url:
+        if not webhook_url.startswith('https://'):
+            errors.append("WEBHOOK_URL must be an https:// URL.")
+        webhook_secret = os.getenv('WEBHOOK_SECRET')
+        if not webhook_secret:
+            warnings.append("WEBHOOK_SECRET is not set, a random one is generated at every start.")
+        elif not WEBHOOK_SECRET_PATTERN.match(webhook_secret):
+            errors.append("WEBHOOK_SECRET may only contain A-Z, a-z, 0-9, _ and - (1-256 characters).")
+
+    if HTML_BACKEND != 'auto' and HTML_BACKEND not in EXTRACTORS:
+        errors.append(f"HTML_BACKEND must be one of auto, {', '.join(EXTRACTORS)}.")
+    elif HTML_BACKEND != 'auto' and HTML_BACKEND not in available_backends():
+        errors.append(f"HTML_BACKEND={HTML_BACKEND} is not installed.")
+
+    if NOTIFIER != 'auto' and NOTIFIER not in NOTIFIERS:
+        errors.append(f"NOTIFIER must be one of auto, {', '.join(NOTIFIERS)}.")
+
+    if DELIVERY_WORKERS < 0:
+        errors.append("DELIVERY_WORKERS must be 0 (deliver in the bot process) or the number of delivery workers.")
+
+    for typ, source in SOURCES.items():
+        missing = [key for key in ('name', 'title', 'url', 'selector') if not source.get(key)]
+        if missing:
+            errors.append(f"Source {typ} is missing {', '.join(missing)}.")
+        elif not source['url'].startswith(('http://', 'https://')) or not {'tag', 'class'} <= source['selector'].keys():
+            errors.append(f"Source {typ} has an invalid url or selector.")
+
+def check_database(errors: list, warnings: list, notes: list):
+    path = Path(db.db_path)
+    if not path.exists():
+        warnings.append(f"{path} does not exist yet, it will be created on the first start.")
+        return
+    try:
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            # Not quick_check: some SQLite 3.40 builds report false NULL errors in WITHOUT ROWID tables
+            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if integrity != 'ok':
+                errors.append(f"{path} failed the integrity check: {integrity}")
+                return
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > db.SCHEMA_VERSION:
+                errors.append(f"{path} has schema version {version}, newer than this bot ({db.SCHEMA_VERSION}).")
+            elif version < db.SCHEMA_VERSION:
+                warnings.append(f"{path} has schema version {version}, it will be migrated to {db.SCHEMA_VERSION} on start.")
+            else:
+                users = conn.execute("SELECT COUNT(*) FROM chat_ids").fetchone()[0]
+                announcements = conn.execute("SELECT COUNT(*) FROM announcements").fetchone()[0]
+                pending = conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+                notes.append(f"{path}: {users} users, {announcements} announcements, {pending} queued notifications.")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        errors.append(f"Could not read {path}: {e}")
+
+def check_leader(warnings: list):
+    # Only tells whether a bot is running on this database, the lock is released right away
+    if not Path(lock_path()).exists():
+        return
+    lock = LeaderLock(lock_path())
+    if lock.acquire():
+        lock.release()
+    else:
+        warnings.append(f"A bot (pid {lock.holder()}) is already running on {db.db_path}, a second one would refuse to start.")
+
+def run_check() -> int:
+    errors, warnings, notes = [], [], []
+    check_packages(errors, warnings)
+    check_config(errors, warnings)
+    check_database(errors, warnings, notes)
+    check_leader(warnings)
+    if available_backends():
+        notes.append(f"HTML parsers: {', '.join(available_backends())} (HTML_BACKEND={HTML_BACKEND}).")
+
+    for note in notes:
+        print(f"OK    {note}")
+    for warning in warnings:
+        print(f"WARN  {warning}")
+    for error in errors:
+        print(f"ERROR {error}")
+    print("Configuration check failed." if errors else "Configuration check passed.")
+    return 1 if errors else 0
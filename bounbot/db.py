@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .metrics import TimedLock
+from .sources import SOURCES
+
+logger = logging.getLogger(__name__)
+
+db_path = os.getenv('DB_PATH', 'theDataBase.db')
+db_lock = TimedLock('db') # Serializes writers only, readers go straight to their own connection
+db_local = threading.local()
+source_ids = {} # Source key -> sources.id, filled by init_db
+
+# Blocking SQLite calls run here so they never stall the event loop
+DB_MAX_WORKERS = int(os.getenv('DB_MAX_WORKERS', 4))
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix='db')
+
+
+# Search text is folded the way people type on a phone: Turkish letters to their ASCII base and
+# lower case. Done before lower() because 'İ'.lower() is 'i' plus a combining dot.
+TURKISH_FOLD_TABLE = str.maketrans('İIıŞşĞğÇçÖöÜüÂâÎîÛû', 'iiissggccoouuaaiiuu')
+
+def fold_turkish(text: str) -> str:
+    return text.translate(TURKISH_FOLD_TABLE).lower() if text else ''
+
+def get_db() -> sqlite3.Connection:
+    # One long-lived connection per thread. WAL lets readers run while the scraper writes,
+    # and the per-connection statement cache keeps the prepared queries around.
+    conn = getattr(db_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, cached_statements=256)
+        conn.create_function('turkish_fold', 1, fold_turkish, deterministic=True) # Used by the search triggers
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # Safe with WAL, avoids an fsync per commit
+        conn.execute("PRAGMA cache_size=-16000") # 16 MB page cache
+        conn.execute("PRAGMA temp_store=MEMORY")
+        db_local.conn = conn
+    return conn
+
+SCHEMA_VERSION = 8
+
+async def run_db(func, *args, **kwargs):
+    # Runs a blocking DB helper on the DB executor and waits for it without blocking the loop
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+def init_db():
+    with db_lock:
+        with get_db() as conn:
+            c = conn.cursor()
+            version = c.execute("PRAGMA user_version").fetchone()[0]
+            legacy = version == 0 and any(row[1] == 'main_announcements' for row in c.execute("PRAGMA table_info(chat_ids)"))
+
+            c.execute('''CREATE TABLE IF NOT EXISTS sources (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            key TEXT UNIQUE NOT NULL,
+                            name TEXT NOT NULL,
+                            url TEXT NOT NULL
+                            )''')
+            c.execute('''CREATE TABLE IF NOT EXISTS announcements (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            source_id INTEGER NOT NULL REFERENCES sources(id),
+                            announcement TEXT NOT NULL,
+                            UNIQUE (source_id, announcement)
+                            )''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_announcements_source ON announcements (source_id, id)")
+            # (source_id, chat_id) as the key makes a fan-out an index range scan, the second index serves /status
+            c.execute('''CREATE TABLE IF NOT EXISTS subscriptions (
+                            chat_id INTEGER NOT NULL,
+                            source_id INTEGER NOT NULL REFERENCES sources(id),
+                            PRIMARY KEY (source_id, chat_id)
+                            ) WITHOUT ROWID''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_chat ON subscriptions (chat_id, source_id)")
+            # Keyword filters of a subscription, added in schema version 4 (see keyword_filters)
+            c.execute('''CREATE TABLE IF NOT EXISTS filters (
+                            chat_id INTEGER NOT NULL,
+                            source_id INTEGER NOT NULL REFERENCES sources(id),
+                            keyword TEXT NOT NULL,
+                            exclude INTEGER NOT NULL DEFAULT 0,
+                            PRIMARY KEY (chat_id, source_id, keyword)
+                            ) WITHOUT ROWID''')
+            c.executemany("INSERT INTO sources (key, name, url) VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET name = excluded.name, url = excluded.url",
+                          [(key, source['name'], source['url']) for key, source in SOURCES.items()])
+
+            if legacy:
+                migrate_legacy_schema(c)
+            else:
+                c.execute('''CREATE TABLE IF NOT EXISTS chat_ids (
+                                id INTEGER PRIMARY KEY,
+                                first_name TEXT,
+                                last_name TEXT,
+                                username TEXT
+                                )''')
+            if 'digest' not in {row[1] for row in c.execute("PRAGMA table_info(chat_ids)")}:
+                # Delivery mode of the chat (see users.DIGEST_MODES), added in schema version 5
+                c.execute("ALTER TABLE chat_ids ADD COLUMN digest TEXT NOT NULL DEFAULT 'instant'")
+            c.execute('''CREATE TABLE IF NOT EXISTS messages (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            chat_id INTEGER,
+                            message TEXT,
+                            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                            )''')
+            c.execute('''CREATE TABLE IF NOT EXISTS outbox_batches (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            typ TEXT NOT NULL,
+                            announcements TEXT NOT NULL,
+                            first_id INTEGER,
+                            last_id INTEGER
+                            )''')
+            if 'first_id' not in {row[1] for row in c.execute("PRAGMA table_info(outbox_batches)")}:
+                # Announcement id range of the batch, added in schema version 2
+                c.execute("ALTER TABLE outbox_batches ADD COLUMN first_id INTEGER")
+                c.execute("ALTER TABLE outbox_batches ADD COLUMN last_id INTEGER")
+            c.execute('''CREATE TABLE IF NOT EXISTS outbox (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            chat_id INTEGER NOT NULL,
+                            batch_id INTEGER NOT NULL REFERENCES outbox_batches(id),
+                            attempts INTEGER DEFAULT 0,
+                            next_attempt_at REAL NOT NULL,
+                            parts_sent INTEGER NOT NULL DEFAULT 0
+                            )''')
+            if 'parts_sent' not in {row[1] for row in c.execute("PRAGMA table_info(outbox)")}:
+                # Message parts already delivered to the chat, added in schema version 8
+                c.execute("ALTER TABLE outbox ADD COLUMN parts_sent INTEGER NOT NULL DEFAULT 0")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox (next_attempt_at)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox (chat_id)") # Claiming all rows of a chat, deleting a chat
+            # Whether a batch is still needed, added in schema version 7
+            c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_id)")
+            # Chats a delivery worker found blocked or gone, deleted by the leader; added in schema version 6
+            c.execute('''CREATE TABLE IF NOT EXISTS removed_chats (
+                            chat_id INTEGER PRIMARY KEY,
+                            removed_at REAL NOT NULL
+                            )''')
+            create_search_index(c)
+            c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+
+            source_ids.update(c.execute("SELECT key, id FROM sources"))
+    logger.info("Database initialized.")
+
+def delete_finished_batches(c: sqlite3.Cursor, batch_ids):
+    # Deletes the outbox batches of `batch_ids` that no outbox row points to anymore (one index lookup each)
+    c.executemany("DELETE FROM outbox_batches WHERE id = ? AND NOT EXISTS (SELECT 1 FROM outbox WHERE batch_id = ?)",
+                  ((batch_id, batch_id) for batch_id in batch_ids))
+
+def create_search_index(c: sqlite3.Cursor):
+    # FTS5 index over the folded announcements, added in schema version 3. It is contentless
+    # (the text stays in announcements, the rowid is announcements.id) and the triggers keep it
+    # in sync with every insert. Runs inside init_db's transaction.
+    if c.execute("SELECT 1 FROM sqlite_master WHERE name = 'announcements_fts'").fetchone() is None:
+        try:
+            c.execute("""CREATE VIRTUAL TABLE announcements_fts USING fts5(
+                            folded, content='', tokenize='unicode61 remove_diacritics 2'
+                            )""")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite has no FTS5, /search is disabled: {e}")
+            return
+        c.execute("INSERT INTO announcements_fts (rowid, folded) SELECT id, turkish_fold(announcement) FROM announcements")
+        logger.info(f"Indexed {c.rowcount} announcements for search.")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS announcements_fts_insert AFTER INSERT ON announcements BEGIN
+                    INSERT INTO announcements_fts (rowid, folded) VALUES (new.id, turkish_fold(new.announcement));
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS announcements_fts_delete AFTER DELETE ON announcements BEGIN
+                    INSERT INTO announcements_fts (announcements_fts, rowid, folded) VALUES ('delete', old.id, turkish_fold(old.announcement));
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS announcements_fts_update AFTER UPDATE OF announcement ON announcements BEGIN
+                    INSERT INTO announcements_fts (announcements_fts, rowid, folded) VALUES ('delete', old.id, turkish_fold(old.announcement));
+                    INSERT INTO announcements_fts (rowid, folded) VALUES (new.id, turkish_fold(new.announcement));
+                 END""")
+
+def migrate_legacy_schema(c: sqlite3.Cursor):
+    # Moves the per-source *_announcements tables and the subscription columns of chat_ids
+    # into announcements/subscriptions. Runs inside init_db's transaction.
+    logger.info("Migrating the database to the sources/subscriptions schema...")
+    tables = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    columns = {row[1] for row in c.execute("PRAGMA table_info(chat_ids)")}
+    for key in SOURCES:
+        source_id = c.execute("SELECT id FROM sources WHERE key = ?", (key,)).fetchone()[0]
+        if f"{key}_announcements" in tables:
+            c.execute(f"""INSERT OR IGNORE INTO announcements (source_id, announcement)
+                          SELECT ?, TRIM(announcement) FROM {key}_announcements ORDER BY id""", (source_id,))
+            c.execute(f"DROP TABLE {key}_announcements")
+        if f"{key}_announcements" in columns:
+            c.execute(f"INSERT OR IGNORE INTO subscriptions (chat_id, source_id) SELECT id, ? FROM chat_ids WHERE {key}_announcements = 1", (source_id,))
+        c.execute(f"DROP INDEX IF EXISTS idx_chat_ids_{key}_subscribers")
+
+    # Rebuild chat_ids without the subscription columns (works on SQLite versions without DROP COLUMN)
+    c.execute('''CREATE TABLE chat_ids_new (
+                    id INTEGER PRIMARY KEY,
+                    first_name TEXT,
+                    last_name TEXT,
+                    username TEXT
+                    )''')
+    c.execute("INSERT INTO chat_ids_new (id, first_name, last_name, username) SELECT id, first_name, last_name, username FROM chat_ids")
+    c.execute("DROP TABLE chat_ids")
+    c.execute("ALTER TABLE chat_ids_new RENAME TO chat_ids")
+    logger.info("Database migration finished.")
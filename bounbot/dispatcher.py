@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import TelegramError, Forbidden, BadRequest, TimedOut, NetworkError, RetryAfter
+
+from .announcements import finish_outbox, get_due_outbox
+from .db import run_db
+from .metrics import metrics
+from .rendering import render_digest, render_new_announcements
+from .users import delete_chat_id
+
+logger = logging.getLogger(__name__)
+
+# --- Notification Dispatcher ---
+SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', 16)) # Messages in flight at the same time
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30)) # Telegram allows ~30 messages/s in total
+TELEGRAM_PER_CHAT_INTERVAL = 1.0 # ...and about 1 message/s to the same chat
+SEND_MAX_ATTEMPTS = 3 # Attempts per chat when Telegram answers with RetryAfter
+
+class TokenBucket:
+    # Token bucket for the event loop. The rate is halved whenever Telegram answers with RetryAfter
+    # and slowly grows back to `max_rate` on successful sends.
+    def __init__(self, max_rate: float, capacity: float = None):
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.capacity = capacity or max_rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                wait = self.paused_until - now
+            else:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def backoff(self, retry_after: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self.rate = max(1.0, self.rate / 2)
+        self.tokens = 0
+        logger.warning(f"Telegram asked to slow down for {retry_after}s. Send rate lowered to {self.rate:.1f} msg/s.")
+
+    def recover(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+class PerChatLimiter:
+    # Keeps at least `interval` seconds between two messages to the same chat
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last_sent = {}
+
+    async def acquire(self, chat_id):
+        now = time.monotonic()
+        if len(self.last_sent) > 10000: # Forget chats that can not be limited anymore
+            self.last_sent = {k: v for k, v in self.last_sent.items() if now - v < self.interval}
+        send_at = max(now, self.last_sent.get(chat_id, 0.0) + self.interval)
+        self.last_sent[chat_id] = send_at
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+PAUSE_CHECK_INTERVAL = 1.0 # Seconds between two reads of the shared pause file
+
+class SharedTokenBucket(TokenBucket):
+    # A worker's share of the global send rate. RetryAfter is flood control for the whole bot token,
+    # so a worker that gets one writes the pause to a file every worker reads before sending.
+    def __init__(self, max_rate: float, path: str):
+        super().__init__(max_rate)
+        self.path = path
+        self.pause_checked = 0.0
+
+    def read_pause(self):
+        try:
+            with open(self.path) as f:
+                paused_until = float(f.read() or 0)
+        except (OSError, ValueError):
+            return
+        remaining = paused_until - time.time()
+        if remaining > 0:
+            self.paused_until = max(self.paused_until, time.monotonic() + remaining)
+
+    async def acquire(self):
+        now = time.monotonic()
+        if now - self.pause_checked >= PAUSE_CHECK_INTERVAL:
+            self.pause_checked = now
+            self.read_pause()
+        await super().acquire()
+
+    def backoff(self, retry_after: float):
+        super().backoff(retry_after)
+        try:
+            with open(self.path, 'w') as f:
+                f.write(str(time.time() + retry_after))
+        except OSError as e:
+            logger.error(f"Could not share the send pause: {e}")
+
+send_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE)
+chat_limiter = PerChatLimiter(TELEGRAM_PER_CHAT_INTERVAL)
+remove_chat = delete_chat_id # Delivery workers queue the removal for the leader instead (sharding.setup_worker)
+
+async def send_one(bot: Bot, chat_id, texts: list[str], first_part=0) -> tuple[str, int]:
+    # Sends the message parts in order, starting at `first_part` (the ones before were delivered by an earlier
+    # attempt). Returns 'sent', 'remove' (user is gone), 'retry' (temporary error) or 'failed', and the parts delivered so far.
+    sent_parts = first_part
+    for attempt in range(1, SEND_MAX_ATTEMPTS + 1):
+        try:
+            while sent_parts < len(texts):
+                await chat_limiter.acquire(chat_id)
+                await send_bucket.acquire()
+                await bot.send_message(chat_id=chat_id, text=texts[sent_parts], parse_mode=ParseMode.MARKDOWN_V2)
+                sent_parts += 1
+                send_bucket.recover()
+            logger.debug(f"Sent notification to {chat_id}")
+            return 'sent', sent_parts
+        except RetryAfter as e:
+            send_bucket.backoff(e.retry_after)
+            if attempt == SEND_MAX_ATTEMPTS:
+                return 'retry', sent_parts
+        except Forbidden:
+            logger.warning(f"Bot unauthorized for chat ID {chat_id}. Marking for removal.")
+            return 'remove', sent_parts
+        except BadRequest as e:
+            logger.error(f"Failed to send to {chat_id}: BadRequest - {e}")
+            if "chat not found" in str(e).lower():
+                logger.warning(f"Chat {chat_id} not found. Marking for removal.")
+                return 'remove', sent_parts
+            return 'failed', sent_parts
+        except (TimedOut, NetworkError) as e:
+            logger.warning(f"Network/Timeout error sending to {chat_id}: {e}.")
+            return 'retry', sent_parts
+        except TelegramError as e:
+            logger.error(f"Telegram error sending to {chat_id}: {e}")
+            return 'failed', sent_parts
+        except Exception as e:
+            logger.error(f"Unexpected error sending message to {chat_id}: {e}")
+            return 'failed', sent_parts
+
+async def dispatch_messages(bot: Bot, chat_ids: list, texts: list[str], first_part=0, semaphore: asyncio.Semaphore = None) -> dict:
+    # Returns the chat ids grouped by send_one status, the parts delivered to the 'retry' chats
+    # ('parts': {chat id: n}), plus the elapsed time and msg/s. Pass `semaphore` to share SEND_CONCURRENCY with other fan-outs.
+    started = time.monotonic()
+    results = {'sent': [], 'remove': [], 'retry': [], 'failed': [], 'parts': {}}
+    semaphore = semaphore or asyncio.Semaphore(SEND_CONCURRENCY)
+
+    async def send(chat_id):
+        async with semaphore:
+            status, sent_parts = await send_one(bot, chat_id, texts, first_part)
+            results[status].append(chat_id)
+            if status == 'retry':
+                results['parts'][chat_id] = sent_parts
+
+    await asyncio.gather(*(send(chat_id) for chat_id in chat_ids))
+    elapsed = time.monotonic() - started
+    results['elapsed'] = elapsed
+    results['rate'] = len(results['sent']) / elapsed if elapsed > 0 else 0.0
+    return results
+
+async def notify_users(bot: Bot, texts: list[str], chat_ids: list, label, first_part=0, semaphore: asyncio.Semaphore = None) -> dict:
+    # Sends one rendered payload to every chat, from part `first_part` on. `label` is the source key, or 'digest' for merged payloads.
+    if not texts or not chat_ids:
+        return {}
+
+    with metrics.timer('bot_phase_seconds', phase='notify', source=label):
+        results = await dispatch_messages(bot, chat_ids, texts, first_part, semaphore)
+    for status_name in ('sent', 'remove', 'retry', 'failed'):
+        if results[status_name]:
+            metrics.inc('bot_sends_total', len(results[status_name]), source=label, status=status_name)
+    failed_count = len(results['remove']) + len(results['retry']) + len(results['failed'])
+
+    logger.info(f"Notifications ({label}) sent attempt complete. Success: {len(results['sent'])}/{len(chat_ids)}. Failures: {failed_count}. "
+                f"Took {results['elapsed']:.1f}s ({results['rate']:.1f} msg/s).")
+
+    # Remove unauthorized/not found users after the fan-out
+    if results['remove']:
+        logger.info(f"Removing {len(results['remove'])} users due to Unauthorized/BadRequest errors.")
+        for chat_id in results['remove']:
+            await run_db(remove_chat, chat_id)
+    return results
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500)) # Notifications claimed per drain step
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BASE_BACKOFF = 30 # Seconds, doubled after every failed attempt
+OUTBOX_MAX_BACKOFF = 6 * 3600
+OUTBOX_DRAIN_INTERVAL = int(os.getenv('OUTBOX_DRAIN_INTERVAL', 10))
+OUTBOX_FINISH_SIZE = 50 # Chats whose outbox rows are updated together; at most these are sent again after a crash
+outbox_drain_lock = asyncio.Lock()
+# Outcomes of sent notifications (finish_outbox arguments) that could not be written. They are
+# retried before the outbox is read again, which would otherwise send the same rows again.
+unfinished_outbox = []
+
+MERGE_NOTIFICATIONS = os.getenv('MERGE_NOTIFICATIONS', '1') != '0' # 0: one message per source batch, as before digests
+
+def render_payload(batches: dict, batch_ids: tuple) -> tuple[list[str], str]:
+    # The texts and metrics label for chats waiting for exactly `batch_ids`
+    if len(batch_ids) == 1:
+        batch = batches[batch_ids[0]]
+        return render_new_announcements(batch['typ'], batch['announcements'], batch['render_key']), batch['typ']
+    return render_digest([(batches[batch_id]['typ'], batches[batch_id]['announcements']) for batch_id in batch_ids], batch_ids), 'digest'
+
+def delivery_outcome(results: dict, recipients: dict, now: float) -> tuple[list, list, set]:
+    # finish_outbox arguments for one notify_users call: removed rows, rescheduled rows and the removed rows' batches
+    done_ids = []
+    retry_rows = []
+    batch_ids = set()
+    for chat_id in results.get('sent', []) + results.get('remove', []) + results.get('failed', []):
+        done_ids.extend(outbox_id for _, outbox_id, _, _ in recipients[chat_id])
+        batch_ids.update(batch_id for batch_id, _, _, _ in recipients[chat_id])
+    for chat_id in results.get('retry', []):
+        # The rows of a merged message are retried together, from the first part the chat did not get
+        attempts = max(attempts for _, _, attempts, _ in recipients[chat_id]) + 1
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Giving up on notifying {chat_id} after {attempts} attempts.")
+            done_ids.extend(outbox_id for _, outbox_id, _, _ in recipients[chat_id])
+            batch_ids.update(batch_id for batch_id, _, _, _ in recipients[chat_id])
+        else:
+            next_attempt_at = now + min(OUTBOX_MAX_BACKOFF, OUTBOX_BASE_BACKOFF * 2 ** attempts)
+            parts_sent = results['parts'][chat_id]
+            retry_rows.extend((outbox_id, attempts, next_attempt_at, parts_sent) for _, outbox_id, _, _ in recipients[chat_id])
+    return done_ids, retry_rows, batch_ids
+
+async def record_delivery(outcome: tuple) -> bool:
+    # Writes one delivery_outcome; keeps it for the next drain and returns False when the DB fails
+    try:
+        await run_db(finish_outbox, *outcome)
+    except sqlite3.Error as e:
+        logger.error(f"Database error updating the outbox, delivery stops until it can be written: {e}")
+        unfinished_outbox.append(outcome)
+        return False
+    if outcome[1]:
+        logger.info(f"{len(outcome[1])} notifications will be retried later.")
+    return True
+
+async def retry_unfinished() -> bool:
+    while unfinished_outbox:
+        try:
+            await run_db(finish_outbox, *unfinished_outbox[0])
+        except sqlite3.Error as e:
+            logger.error(f"Database error updating the outbox, not reading it again yet: {e}")
+            return False
+        unfinished_outbox.pop(0)
+    return True
+
+async def drain_outbox(bot: Bot, shard: tuple[int, int] = None) -> dict:
+    # Delivers every due outbox notification (of one shard when given); work per call is
+    # proportional to the pending rows only. All due rows of a chat become one message, and chats
+    # waiting for the same batches share one rendered payload. The payloads go out side by side under
+    # one SEND_CONCURRENCY limit and send_bucket. Rows are finished every OUTBOX_FINISH_SIZE chats,
+    # and the drain stops when that fails. Returns {'payloads': n, 'messages': n}.
+    stats = {'payloads': 0, 'messages': 0}
+    if outbox_drain_lock.locked():
+        return stats # Another drain is still running
+    async with outbox_drain_lock:
+        while await retry_unfinished():
+            rows = await run_db(get_due_outbox, OUTBOX_BATCH_SIZE, shard)
+            if not rows:
+                break
+
+            batches = {}
+            chats = {} # Chat id -> [(batch id, outbox id, attempts, parts sent)], oldest batch first
+            for outbox_id, chat_id, attempts, parts_sent, batch_id, typ, announcements, first_id, last_id in rows:
+                if batch_id not in batches:
+                    render_key = (first_id, last_id) if first_id is not None else ('batch', batch_id)
+                    batches[batch_id] = {'typ': typ, 'announcements': json.loads(announcements), 'render_key': render_key}
+                chats.setdefault(chat_id, []).append((batch_id, outbox_id, attempts, parts_sent))
+
+            payloads = {} # (batch ids, first part to send) -> {chat id: its rows}
+            for chat_id, entries in chats.items():
+                entries.sort()
+                resumed = [entry for entry in entries if entry[3]]
+                if resumed:
+                    # A partly delivered message is finished as it was rendered; the chat's other rows wait for the next step
+                    resumed = [entry for entry in resumed if entry[3] == resumed[0][3]] if MERGE_NOTIFICATIONS else resumed[:1]
+                    payloads.setdefault((tuple(entry[0] for entry in resumed), resumed[0][3]), {})[chat_id] = resumed
+                elif MERGE_NOTIFICATIONS:
+                    payloads.setdefault((tuple(entry[0] for entry in entries), 0), {})[chat_id] = entries
+                else:
+                    for entry in entries:
+                        payloads.setdefault(((entry[0],), 0), {})[chat_id] = [entry]
+
+            semaphore = asyncio.Semaphore(SEND_CONCURRENCY) # Messages in flight, over all payloads
+            chunk_slots = asyncio.Semaphore(SEND_CONCURRENCY) # Chunks being sent, so a failed write stops the ones not started
+            write_failed = asyncio.Event()
+
+            async def deliver(texts, label, first_part, recipients, chunk):
+                async with chunk_slots:
+                    if write_failed.is_set():
+                        return # Its rows stay due
+                    results = await notify_users(bot, texts, chunk, label, first_part, semaphore)
+                    stats['messages'] += len(chunk)
+                    if not await record_delivery(delivery_outcome(results, recipients, time.time())):
+                        write_failed.set()
+
+            deliveries = []
+            for (batch_ids, first_part), recipients in payloads.items():
+                texts, label = render_payload(batches, batch_ids)
+                stats['payloads'] += 1
+                chat_ids = list(recipients)
+                deliveries.extend(deliver(texts, label, first_part, recipients, chat_ids[start:start + OUTBOX_FINISH_SIZE])
+                                  for start in range(0, len(chat_ids), OUTBOX_FINISH_SIZE))
+            if MERGE_NOTIFICATIONS:
+                await asyncio.gather(*deliveries) # A chat is in one payload only
+            else:
+                for delivery in deliveries: # A chat gets one message per batch, oldest first
+                    await delivery
+            if write_failed.is_set():
+                break
+    return stats
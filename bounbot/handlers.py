@@ -0,0 +1,261 @@
+import logging
+import os
+import sqlite3
+
+from telegram import Update
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from .db import run_db
+from .keyword_filters import FILTER_MAX_KEYWORDS, add_filters, get_chat_filters, remove_filters
+from .messages import message_buffer
+from .metrics import PROFILE_DIR, profile_requests
+from .monitoring import metrics_summary_lines
+from .rendering import render_latest, split_message
+from .search import render_search
+from .sources import SOURCES
+from .users import (DIGEST_DAILY_HOUR, DIGEST_MODES, delete_chat_id, get_digest_mode, get_user_subscriptions, save_chat_id,
+                    set_digest_mode, subscribe, unsubscribe)
+
+logger = logging.getLogger(__name__)
+
+COMMAND_CONCURRENCY = int(os.getenv('COMMAND_CONCURRENCY', 32)) # Updates handled at the same time
+ADMIN_CHAT_ID = int(os.getenv('ADMIN_CHAT_ID', 0)) # Only this chat may use /metrics and /profile
+
+
+# --- Command Handlers ---
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    user_name = update.effective_user.first_name
+    logger.info(f"/status command received from {user_name} ({chat_id})")
+    subscriptions = get_user_subscriptions(chat_id)
+    if subscriptions:
+        status_message = "Abonelik durumun:\n"
+        for typ, source in SOURCES.items():
+            if subscriptions[typ]:
+                status_message += f"{source['name']} duyurularına abonesin, abonelikten çıkmak için: \n/unsubscribe_{typ}\n"
+            else:
+                status_message += f"{source['name']} duyurularına abone değilsin, abone olmak için: \n/subscribe_{typ}\n"
+        status_message += (
+            f"Duyuru bildirimlerini tamamen kapatmak için /stop komutunu kullanabilirsin.\n"
+            f"/latest, /start"
+            f"\n\n-Kömen")
+        await update.message.reply_text(status_message)
+    else:
+        await update.message.reply_text("Seni bulamadım. Lütfen /start komutunu kullanarak kaydolmayı dene.")
+
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    user_name = update.effective_user.first_name
+    logger.info(f"/start command received from {user_name} ({chat_id})")
+    if await run_db(save_chat_id, update.effective_chat):
+        await update.message.reply_text(
+            f"Merhaba {user_name}! 👋\n"
+            f"Benim görevim yeni bir duyuru olduğunda sana haber vermek.\n"
+            f"Son duyuruları görmek için /latest komutunu kullanabilirsin.\n"
+            f"Duyuru bildirimlerini tamamen kapatmak için /stop komutunu kullanabilirsin."
+            f"\nAbonelik durumunu görmek için /status komutunu kullanabilirsin."
+            f"\n\n-Kömen"
+        )
+    else:
+        await update.message.reply_text(
+            "Merhaba! Seni kaydederken bir sorun oluştu. Lütfen daha sonra tekrar dene veya yönetici ile iletişime geç."
+        )
+
+async def fetch_latest_announcements(update: Update, context: ContextTypes.DEFAULT_TYPE, typ, limit):
+    try:
+        chunks = await run_db(render_latest, typ, limit)
+    except sqlite3.Error as e:
+        logger.error(f"Database error getting latest {typ.upper()} announcements: {e}")
+        await update.message.reply_text("Duyuruları getirirken bir veritabanı hatası oluştu. 😟")
+        return 
+    if chunks:
+        for chunk in chunks:
+            await update.message.reply_text(chunk, parse_mode=ParseMode.MARKDOWN_V2)
+    else:
+        await update.message.reply_text(f"Veritabanında kayıtlı {SOURCES[typ]['name']} duyurusu bulunamadı. Belki de henüz hiç duyuru yayınlanmadı? 🤔")
+
+async def latest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    logger.info(f"/latest command received from {update.effective_chat.id}")
+    limit = 5
+    types = get_user_subscriptions(update.effective_chat.id)
+    for typ in types:
+        if types[typ] == 1:
+            await fetch_latest_announcements(update, context, typ, limit)
+
+async def send_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE, query: str, page: int):
+    try:
+        chunks, has_more = await run_db(render_search, query, page)
+    except sqlite3.Error as e:
+        logger.error(f"Database error searching for {query!r}: {e}")
+        await update.message.reply_text("Arama yaparken bir veritabanı hatası oluştu. 😟")
+        return
+    if not chunks:
+        await update.message.reply_text("Aramana uygun bir duyuru bulunamadı. 🤔" if page == 1 else "Başka sonuç yok.")
+        context.chat_data.pop('search', None)
+        return
+    context.chat_data['search'] = (query, page) if has_more else None
+    for chunk in chunks:
+        await update.message.reply_text(chunk, parse_mode=ParseMode.MARKDOWN_V2)
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = ' '.join(context.args)
+    logger.info(f"/search command received from {update.effective_chat.id}: {query}")
+    if not query.strip():
+        await update.message.reply_text("Kullanım: /search <aranacak kelimeler>\nÖrnek: /search yeterlik sınavı")
+        return
+    await send_search_page(update, context, query, 1)
+
+async def more(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Next page of the chat's last /search
+    last = context.chat_data.get('search')
+    if not last:
+        await update.message.reply_text("Devam edecek bir arama yok. /search ile yeni bir arama yapabilirsin.")
+        return
+    query, page = last
+    await send_search_page(update, context, query, page + 1)
+
+def describe_filters(chat_id) -> str:
+    chat_filters = get_chat_filters(chat_id)
+    if not chat_filters:
+        return "Hiç filtren yok, abone olduğun kaynakların bütün duyurularını alıyorsun."
+    lines = ["Filtrelerin:"]
+    for typ, (include, exclude) in chat_filters.items():
+        parts = []
+        if include:
+            parts.append(f"sadece {', '.join(include)} geçenler")
+        if exclude:
+            parts.append(f"{', '.join(exclude)} geçenler hariç")
+        lines.append(f"{SOURCES[typ]['name']}: {'; '.join(parts)}")
+    return '\n'.join(lines)
+
+FILTER_USAGE = (
+    f"Kullanım: /filter <{'|'.join(SOURCES)}> kelime -kelime\n"
+    "Kelime: sadece bu kelimeyi içeren duyuruları gönder. -kelime: bu kelimeyi içeren duyuruları gönderme.\n"
+    f"Örnek: /filter main sınav burs -yemek (kaynak başına en fazla {FILTER_MAX_KEYWORDS} kelime)\n"
+    "Filtreleri kaldırmak için: /unfilter <kaynak> [kelime ...]"
+)
+
+async def filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    logger.info(f"/filter command received from {chat_id}: {context.args}")
+    if not get_user_subscriptions(chat_id):
+        await update.message.reply_text("Seni bulamadım. Lütfen /start komutunu kullanarak kaydolmayı dene.")
+        return
+    typ = context.args[0].lower() if context.args else None
+    words = context.args[1:]
+    if typ not in SOURCES or not words:
+        await update.message.reply_text(f"{describe_filters(chat_id)}\n\n{FILTER_USAGE}")
+        return
+    include = [word.lstrip('+') for word in words if not word.startswith('-')]
+    exclude = [word.lstrip('-') for word in words if word.startswith('-')]
+    try:
+        added = await run_db(add_filters, chat_id, typ, include, False) if include else []
+        added += await run_db(add_filters, chat_id, typ, exclude, True) if exclude else []
+    except sqlite3.Error as e:
+        logger.error(f"Database error adding filters for {chat_id}: {e}")
+        await update.message.reply_text("Filtreyi kaydederken bir veritabanı hatası oluştu. 😟")
+        return
+    if not added:
+        await update.message.reply_text(f"Geçerli bir kelime bulamadım ya da kelime sınırına ulaştın.\n\n{FILTER_USAGE}")
+        return
+    await update.message.reply_text(describe_filters(chat_id))
+
+async def unfilter_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    logger.info(f"/unfilter command received from {chat_id}: {context.args}")
+    typ = context.args[0].lower() if context.args else None
+    if typ not in SOURCES:
+        await update.message.reply_text(f"{describe_filters(chat_id)}\n\n{FILTER_USAGE}")
+        return
+    words = [word.lstrip('+-') for word in context.args[1:]] or None
+    try:
+        removed = await run_db(remove_filters, chat_id, typ, words)
+    except sqlite3.Error as e:
+        logger.error(f"Database error removing filters for {chat_id}: {e}")
+        await update.message.reply_text("Filtreyi silerken bir veritabanı hatası oluştu. 😟")
+        return
+    if not removed:
+        await update.message.reply_text(f"Silinecek bir filtre bulamadım.\n\n{describe_filters(chat_id)}")
+        return
+    await update.message.reply_text(describe_filters(chat_id))
+
+DIGEST_DESCRIPTIONS = {
+    'instant': "yeni duyuruları bulunur bulunmaz",
+    'hourly': "yeni duyuruları saatte bir, tek mesajda",
+    'daily': f"yeni duyuruları günde bir kez saat {DIGEST_DAILY_HOUR:02d}:00'da, tek mesajda",
+}
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    logger.info(f"/digest command received from {chat_id}: {context.args}")
+    if not get_user_subscriptions(chat_id):
+        await update.message.reply_text("Seni bulamadım. Lütfen /start komutunu kullanarak kaydolmayı dene.")
+        return
+    mode = context.args[0].lower() if context.args else None
+    if mode not in DIGEST_MODES:
+        await update.message.reply_text(
+            f"Şu an {DIGEST_DESCRIPTIONS[get_digest_mode(chat_id)]} alıyorsun.\n"
+            f"Değiştirmek için: /digest <{'|'.join(DIGEST_MODES)}>")
+        return
+    if await run_db(set_digest_mode, chat_id, mode):
+        await update.message.reply_text(f"Tamam, artık {DIGEST_DESCRIPTIONS[mode]} alacaksın.")
+    else:
+        await update.message.reply_text("Bildirim sıklığını değiştirirken bir sorun oluştu.")
+
+async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    user_name = update.effective_user.first_name
+    logger.info(f"/stop command received from {user_name} ({chat_id})")
+    if await run_db(delete_chat_id, chat_id):
+        await update.message.reply_text("YADYOK duyuru bildirimlerin kapatıldı. Tekrar başlatmak istersen /start komutunu kullanabilirsin. Görüşmek üzere! 👋")
+    else:
+        await update.message.reply_text("Bildirimlerini kapatırken bir sorun oluştu veya zaten abone değildin.")
+
+async def subscribe_to_source(update: Update, context: ContextTypes.DEFAULT_TYPE, typ):
+    chat_id = update.effective_chat.id
+    name = SOURCES[typ]['name']
+    if await run_db(subscribe, chat_id, typ):
+        await update.message.reply_text(f"{name} duyurularına abone oldun!")
+    else:
+        await update.message.reply_text(f"{name} duyurularına abone olurken bir sorun oluştu.")
+
+async def unsubscribe_from_source(update: Update, context: ContextTypes.DEFAULT_TYPE, typ):
+    chat_id = update.effective_chat.id
+    name = SOURCES[typ]['name']
+    if await run_db(unsubscribe, chat_id, typ):
+        await update.message.reply_text(f"{name} duyurularından çıkış yaptın.")
+    else:
+        await update.message.reply_text(f"{name} duyurularından çıkış yaparken bir sorun oluştu.")
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    message_text = update.message.text
+
+    await message_buffer.add(chat_id, message_text)
+
+    logger.info(f"Received message from {chat_id}: {message_text}")
+
+
+# --- Admin Commands ---
+def is_admin(update: Update) -> bool:
+    return bool(ADMIN_CHAT_ID) and update.effective_chat.id == ADMIN_CHAT_ID
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        logger.warning(f"/metrics command denied for {update.effective_chat.id}")
+        return
+    for chunk in split_message("Metrikler:", metrics_summary_lines()):
+        await update.message.reply_text(chunk)
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        logger.warning(f"/profile command denied for {update.effective_chat.id}")
+        return
+    typ = context.args[0] if context.args else None
+    if typ not in SOURCES:
+        await update.message.reply_text(f"Kullanım: /profile <{'|'.join(SOURCES)}>")
+        return
+    profile_requests.add(typ)
+    await update.message.reply_text(f"{SOURCES[typ]['name']} için bir sonraki kontrol profillenecek ({PROFILE_DIR}/).")
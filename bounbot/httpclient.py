@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive'
+}
+
+# --- HTTP Clients ---
+# One httpx.AsyncClient per host, so a slow host can only tie up its own connections. Connections
+# are kept alive between polls of the same host.
+FETCH_TIMEOUT = int(os.getenv('FETCH_TIMEOUT', 20)) # Per-request timeout for a single source
+FETCH_CONNECT_TIMEOUT = float(os.getenv('FETCH_CONNECT_TIMEOUT', 5)) # A host that does not accept a connection by then is down
+FETCH_HOST_CONNECTIONS = int(os.getenv('FETCH_HOST_CONNECTIONS', 2)) # Connection pool size per host
+FETCH_KEEPALIVE_EXPIRY = 60 # Seconds an idle connection is kept
+
+http_clients = {} # Host -> httpx.AsyncClient, created on first use
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    host = urlsplit(url).netloc
+    client = http_clients.get(host)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers=headers, verify=False, follow_redirects=True, # Like requests did; the university hosts move pages around
+            timeout=httpx.Timeout(FETCH_TIMEOUT, connect=min(FETCH_CONNECT_TIMEOUT, FETCH_TIMEOUT)),
+            limits=httpx.Limits(max_connections=FETCH_HOST_CONNECTIONS, max_keepalive_connections=FETCH_HOST_CONNECTIONS,
+                                keepalive_expiry=FETCH_KEEPALIVE_EXPIRY),
+        )
+        http_clients[host] = client
+    return client
+
+async def close_http_client():
+    clients = list(http_clients.values())
+    http_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+# --- Retries ---
+# GETs are retried on connection errors and on answers that say "try again" (429, 5xx), with full
+# jitter: a random wait between 0 and base * 2^attempt. A Retry-After header wins over the backoff.
+# A retry that would not finish within FETCH_TIMEOUT of the first attempt is not started.
+FETCH_RETRIES = int(os.getenv('FETCH_RETRIES', 2)) # Extra attempts after the first one
+FETCH_RETRY_BASE = float(os.getenv('FETCH_RETRY_BASE', 0.5)) # Seconds
+FETCH_RETRY_MAX = 10 # Longest wait between two attempts
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+def retry_delay(attempt: int, response: httpx.Response = None) -> float:
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        return min(FETCH_RETRY_MAX, int(retry_after))
+    return random.uniform(0, min(FETCH_RETRY_MAX, FETCH_RETRY_BASE * 2 ** attempt))
+
+async def get_with_retries(url: str, label: str, **kwargs) -> httpx.Response:
+    # Returns the last response, which can still be an error status. Raises the last request error.
+    started = time.monotonic()
+    for attempt in range(FETCH_RETRIES + 1):
+        response, error = None, None
+        try:
+            response = await get_http_client(url).get(url, **kwargs)
+        except RETRY_ERRORS as e:
+            error = e
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            return response
+        delay = retry_delay(attempt, response)
+        if attempt == FETCH_RETRIES or time.monotonic() - started + delay > FETCH_TIMEOUT:
+            if error is not None:
+                raise error
+            return response
+        reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+        logger.warning(f"Retrying {label.upper()} in {delay:.1f}s after {reason} (attempt {attempt + 1}/{FETCH_RETRIES}).")
+        metrics.inc('bot_fetch_retries_total', source=label)
+        await asyncio.sleep(delay)
+
+# --- Circuit Breakers ---
+# Every source has a breaker. After BREAKER_THRESHOLD failed fetches in a row it opens and the source
+# is not fetched at all until BREAKER_COOLDOWN has passed. Then it is half open: the next fetch is a
+# probe that closes it on success, or opens it again with twice the cooldown.
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 3))
+BREAKER_COOLDOWN = int(os.getenv('BREAKER_COOLDOWN', 600)) # Seconds until the first probe
+BREAKER_MAX_COOLDOWN = 6 * 3600
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2} # Gauge values
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = 'closed'
+        self.failures = 0 # Failed fetches in a row
+        self.cooldown = BREAKER_COOLDOWN
+        self.open_until = 0.0
+
+    def allow(self) -> bool:
+        # Whether the source may be fetched now; an open breaker turns half open once its cooldown is over
+        if self.state == 'open':
+            if time.monotonic() < self.open_until:
+                return False
+            self.transition('half_open')
+        return True
+
+    def retry_in(self) -> float:
+        return max(0.0, self.open_until - time.monotonic()) if self.state == 'open' else 0.0
+
+    def record_success(self):
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        if self.state != 'closed':
+            self.transition('closed')
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open':
+            self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+            self.open()
+        elif self.state == 'closed' and self.failures >= BREAKER_THRESHOLD:
+            self.open()
+
+    def open(self):
+        self.open_until = time.monotonic() + self.cooldown
+        self.transition('open')
+
+    def transition(self, state: str):
+        logger.warning(f"Circuit of {self.name.upper()} is now {state} ({self.failures} failures in a row"
+                       f"{f', next probe in {self.cooldown}s' if state == 'open' else ''}).")
+        self.state = state
+        metrics.inc('bot_circuit_transitions_total', source=self.name, state=state)
+
+breakers = {} # Source key -> CircuitBreaker
+
+def get_breaker(typ) -> CircuitBreaker:
+    breaker = breakers.get(typ)
+    if breaker is None:
+        breaker = breakers[typ] = CircuitBreaker(typ)
+    return breaker
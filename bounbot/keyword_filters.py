@@ -0,0 +1,216 @@
+import logging
+import re
+import threading
+from collections import defaultdict
+
+from .db import db_lock, fold_turkish, get_db, source_ids
+from .sources import SOURCES
+
+logger = logging.getLogger(__name__)
+
+# --- Keyword Filters ---
+# A chat can narrow a source down with include keywords (only announcements containing one of them)
+# and exclude keywords (never announcements containing one of them). Keywords are folded like the
+# search index and match at the start of a word, so "sinav" also matches "Sınavı".
+#
+# Every source keeps an in-memory index: keyword -> chats, and one regex compiled from a trie of all
+# its keywords. Matching an announcement is a single pass of that regex, so its cost depends on the
+# length of the text and not on how many chats or keywords there are.
+FILTER_MAX_KEYWORDS = 20 # Per chat and source
+FILTER_MIN_LENGTH = 2
+FILTER_MAX_LENGTH = 50
+FILTER_KEYWORD_PATTERN = re.compile(r'\w+') # One word per keyword
+
+def normalize_keyword(keyword: str) -> str:
+    return ' '.join(fold_turkish(keyword).split())
+
+def trie_pattern(keywords) -> str:
+    # Regex matching the longest of `keywords` at a position; shared prefixes are merged, so the
+    # regex engine only follows one branch per character
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
+    return build(trie)
+
+class SourceFilters:
+    def __init__(self):
+        self.chats = {} # Chat id -> {keyword: True if exclude}
+        self.include = defaultdict(set) # Keyword -> chats including it
+        self.exclude = defaultdict(set) # Keyword -> chats excluding it
+        self.include_chats = set() # Chats with at least one include keyword
+        self.pattern = None
+        self.dirty = True
+        self.lock = threading.Lock()
+
+    def add(self, chat_id, keyword: str, exclude: bool):
+        with self.lock:
+            self.discard_locked(chat_id, keyword)
+            self.chats.setdefault(chat_id, {})[keyword] = exclude
+            (self.exclude if exclude else self.include)[keyword].add(chat_id)
+            if not exclude:
+                self.include_chats.add(chat_id)
+            self.dirty = True
+
+    def discard_locked(self, chat_id, keyword: str):
+        keywords = self.chats.get(chat_id)
+        if not keywords or keyword not in keywords:
+            return
+        index = self.exclude if keywords.pop(keyword) else self.include
+        index[keyword].discard(chat_id)
+        if not index[keyword]:
+            del index[keyword]
+        if not keywords:
+            del self.chats[chat_id]
+        if not any(not exclude for exclude in keywords.values()):
+            self.include_chats.discard(chat_id)
+        self.dirty = True
+
+    def discard(self, chat_id, keywords=None):
+        # Drops the given keywords of the chat, or all of them
+        with self.lock:
+            for keyword in list(self.chats.get(chat_id, {}) if keywords is None else keywords):
+                self.discard_locked(chat_id, keyword)
+
+    def matcher(self):
+        # Recompiled on the first match after a change, not on every command
+        with self.lock:
+            if self.dirty:
+                keywords = self.include.keys() | self.exclude.keys()
+                self.pattern = re.compile(rf"\b(?=({trie_pattern(keywords)}))") if keywords else None
+                self.dirty = False
+            return self.pattern
+
+    def match(self, announcement: str) -> set:
+        # The keywords found in the announcement
+        pattern = self.matcher()
+        if pattern is None:
+            return set()
+        text = ' '.join(fold_turkish(announcement).split())
+        found = set()
+        for match in pattern.finditer(text):
+            keyword = match.group(1)
+            found.add(keyword)
+            # The regex reports the longest keyword at a position, shorter ones there are its prefixes
+            found.update(keyword[:end] for end in range(FILTER_MIN_LENGTH, len(keyword))
+                         if keyword[:end] in self.include or keyword[:end] in self.exclude)
+        return found
+
+    def recipients(self, announcement: str, chat_ids: set) -> set:
+        # Which of the filtered `chat_ids` get the announcement
+        found = self.match(announcement)
+        included = set().union(*(self.include.get(keyword, ()) for keyword in found))
+        excluded = set().union(*(self.exclude.get(keyword, ()) for keyword in found))
+        return ((chat_ids - self.include_chats) | (chat_ids & included)) - excluded
+
+filter_index = {typ: SourceFilters() for typ in SOURCES}
+
+def load_filters():
+    keys = {source_id: key for key, source_id in source_ids.items()}
+    count = 0
+    with get_db() as conn:
+        for chat_id, source_id, keyword, exclude in conn.execute("SELECT chat_id, source_id, keyword, exclude FROM filters"):
+            if source_id in keys:
+                filter_index[keys[source_id]].add(chat_id, keyword, bool(exclude))
+                count += 1
+    logger.info(f"Loaded {count} keyword filters of {len({chat for f in filter_index.values() for chat in f.chats})} users.")
+
+def check_filters() -> int:
+    # Compares the index with the DB and rebuilds the sources that differ. Returns their number. Raises sqlite3.Error.
+    keys = {source_id: key for key, source_id in source_ids.items()}
+    stored = {typ: {} for typ in filter_index}
+    differing = 0
+    with db_lock:
+        with get_db() as conn:
+            for chat_id, source_id, keyword, exclude in conn.execute("SELECT chat_id, source_id, keyword, exclude FROM filters"):
+                if keys.get(source_id) in stored:
+                    stored[keys[source_id]].setdefault(chat_id, {})[keyword] = bool(exclude)
+        for typ, chats in stored.items():
+            with filter_index[typ].lock:
+                cached = {chat_id: dict(keywords) for chat_id, keywords in filter_index[typ].chats.items()}
+            if cached != chats:
+                rebuilt = SourceFilters()
+                for chat_id, keywords in chats.items():
+                    for keyword, exclude in keywords.items():
+                        rebuilt.add(chat_id, keyword, exclude)
+                filter_index[typ] = rebuilt
+                differing += 1
+    if differing:
+        logger.warning(f"Keyword filters of {differing} sources differed from the DB, rebuilt them.")
+    return differing
+
+def filtered_chats(typ) -> set:
+    with filter_index[typ].lock:
+        return set(filter_index[typ].chats)
+
+def get_chat_filters(chat_id) -> dict:
+    # {source key: (include keywords, exclude keywords)} for the sources the chat filters. Memory only.
+    result = {}
+    for typ, source_filters in filter_index.items():
+        with source_filters.lock:
+            keywords = dict(source_filters.chats.get(chat_id, {}))
+        if keywords:
+            result[typ] = (sorted(k for k, exclude in keywords.items() if not exclude), sorted(k for k, exclude in keywords.items() if exclude))
+    return result
+
+def add_filters(chat_id, typ, keywords: list[str], exclude: bool) -> list[str]:
+    # Stores the keywords (normalized) and returns them, [] when nothing valid was given. Raises sqlite3.Error.
+    keywords = [keyword for keyword in dict.fromkeys(map(normalize_keyword, keywords))
+                if FILTER_MIN_LENGTH <= len(keyword) <= FILTER_MAX_LENGTH and FILTER_KEYWORD_PATTERN.fullmatch(keyword)]
+    existing = filter_index[typ].chats.get(chat_id, {})
+    keywords = keywords[:max(0, FILTER_MAX_KEYWORDS - len(existing.keys() - set(keywords)))]
+    if not keywords:
+        return []
+    with db_lock:
+        with get_db() as conn:
+            conn.executemany("INSERT OR REPLACE INTO filters (chat_id, source_id, keyword, exclude) VALUES (?, ?, ?, ?)",
+                             [(chat_id, source_ids[typ], keyword, int(exclude)) for keyword in keywords])
+            conn.commit()
+            for keyword in keywords:
+                filter_index[typ].add(chat_id, keyword, exclude)
+    logger.info(f"Chat ID {chat_id} added {'exclude' if exclude else 'include'} filters for {typ}: {keywords}")
+    return keywords
+
+def remove_filters(chat_id, typ, keywords: list[str] = None) -> int:
+    # Removes the given keywords of the chat for `typ`, or all of them. Returns how many were removed. Raises sqlite3.Error.
+    with db_lock:
+        with get_db() as conn:
+            if keywords is None:
+                c = conn.execute("DELETE FROM filters WHERE chat_id = ? AND source_id = ?", (chat_id, source_ids[typ]))
+            else:
+                keywords = [normalize_keyword(keyword) for keyword in keywords]
+                c = conn.executemany("DELETE FROM filters WHERE chat_id = ? AND source_id = ? AND keyword = ?",
+                                     [(chat_id, source_ids[typ], keyword) for keyword in keywords])
+            removed = c.rowcount
+            conn.commit()
+            filter_index[typ].discard(chat_id, keywords)
+    logger.info(f"Chat ID {chat_id} removed {removed} filters for {typ}.")
+    return removed
+
+def forget_chat(chat_id):
+    # Cache side of deleting a chat, the rows go in users.delete_chat_id's transaction
+    for source_filters in filter_index.values():
+        source_filters.discard(chat_id)
+
+def route_filtered(typ, announcements: list[str], chat_ids) -> list[tuple[list[str], list]]:
+    # Groups the filtered chats by the announcements they get: [(announcements, chat ids)], in the
+    # given order, leaving out chats that get none of them
+    chat_ids = set(chat_ids)
+    masks = defaultdict(int)
+    for i, announcement in enumerate(announcements):
+        for chat_id in filter_index[typ].recipients(announcement, chat_ids):
+            masks[chat_id] |= 1 << i
+    groups = defaultdict(list)
+    for chat_id, mask in masks.items():
+        groups[mask].append(chat_id)
+    return [([announcement for i, announcement in enumerate(announcements) if mask >> i & 1], sorted(chats))
+            for mask, chats in groups.items()]
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from .db import db_lock, get_db, run_db
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def save_messages(rows: list[tuple]):
+    # One transaction (and one fsync) for the whole batch, raises sqlite3.Error so the caller can keep the rows
+    with db_lock:
+        with get_db() as conn:
+            conn.executemany("""
+                INSERT INTO messages (chat_id, message, timestamp)
+                VALUES (?, ?, ?)
+            """, rows)
+
+# Incoming messages are buffered in memory and written in batches, either when the buffer
+# reaches MESSAGE_FLUSH_SIZE or every MESSAGE_FLUSH_INTERVAL seconds, whichever comes first.
+MESSAGE_FLUSH_SIZE = int(os.getenv('MESSAGE_FLUSH_SIZE', 200))
+MESSAGE_FLUSH_INTERVAL = float(os.getenv('MESSAGE_FLUSH_INTERVAL', 2))
+MESSAGE_BUFFER_LIMIT = int(os.getenv('MESSAGE_BUFFER_LIMIT', 10000)) # Oldest rows are dropped past this while the DB is failing
+
+class MessageBuffer:
+    def __init__(self, flush_size, limit):
+        self.flush_size = flush_size
+        self.limit = limit
+        self.pending = []
+        self.flush_lock = asyncio.Lock() # One flush at a time keeps the rows in arrival order
+        self.flush_task = None
+        self.stats = {'depth': 0, 'flushes': 0, 'flushed': 0, 'failed_flushes': 0, 'dropped': 0,
+                      'last_flush_ms': 0.0, 'max_flush_ms': 0.0}
+
+    async def add(self, chat_id, message):
+        # Same format as SQLite's CURRENT_TIMESTAMP, taken now rather than at flush time
+        received_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self.pending.append((chat_id, message, received_at))
+        self.stats['depth'] = len(self.pending)
+        if len(self.pending) >= self.flush_size and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            rows, self.pending = self.pending, []
+            started = time.perf_counter()
+            try:
+                await run_db(save_messages, rows)
+            except sqlite3.Error as e:
+                logger.error(f"Error saving {len(rows)} messages, keeping them for the next flush: {e}")
+                self.stats['failed_flushes'] += 1
+                self.pending = rows + self.pending
+                overflow = len(self.pending) - self.limit
+                if overflow > 0:
+                    del self.pending[:overflow]
+                    self.stats['dropped'] += overflow
+                    logger.warning(f"Message buffer is full, dropped the {overflow} oldest messages.")
+                return
+            finally:
+                self.stats['depth'] = len(self.pending)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.observe('bot_phase_seconds', elapsed_ms / 1000, phase='message_flush', source='all')
+            self.stats['flushes'] += 1
+            self.stats['flushed'] += len(rows)
+            self.stats['last_flush_ms'] = round(elapsed_ms, 2)
+            self.stats['max_flush_ms'] = round(max(self.stats['max_flush_ms'], elapsed_ms), 2)
+            logger.info(f"Saved {len(rows)} messages in {elapsed_ms:.1f}ms (buffer depth {len(self.pending)}).")
+
+message_buffer = MessageBuffer(MESSAGE_FLUSH_SIZE, MESSAGE_BUFFER_LIMIT)
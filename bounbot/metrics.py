@@ -0,0 +1,99 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics ---
+# Counters and latency histograms for every phase of a poll and of the fan-out. They are read by
+# the /metrics admin command and served in the Prometheus text format when METRICS_PORT is set.
+# Updated from the event loop and from the DB threads, hence the lock.
+METRIC_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60) # Seconds
+
+class Metrics:
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.counters = {} # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> {'buckets': [...], 'count': n, 'sum': s, 'max': s}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0, 'max': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        # Works around awaits too: `with metrics.timer(...): await ...`
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: dict(histogram, buckets=list(histogram['buckets'])) for key, histogram in self.histograms.items()}
+        return counters, histograms
+
+metrics = Metrics()
+
+class TimedLock:
+    # threading.Lock that records how long callers waited for it
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self.lock.acquire()
+        metrics.observe('bot_lock_wait_seconds', time.perf_counter() - started, lock=self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+# --- Profiling ---
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+# Sources whose next check runs under cProfile, from PROFILE_SOURCES=main,mis or /profile <source>
+profile_requests = {typ.strip() for typ in os.getenv('PROFILE_SOURCES', '').split(',') if typ.strip()}
+
+async def run_profiled(name, coroutine):
+    # Runs one job under cProfile and saves the stats. Only the event loop thread is profiled:
+    # time spent in the DB and parser threads shows up as the await that waited for it.
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return await coroutine
+    finally:
+        profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(15)
+        path = os.path.join(PROFILE_DIR, f"{name}_{datetime.now():%Y%m%d_%H%M%S}.prof")
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(path)
+            logger.info(f"Profile of {name} saved to {path}\n{report.getvalue()}")
+        except OSError as e: # Never fail the profiled job because of the report
+            logger.error(f"Could not save the profile of {name} to {path}: {e}\n{report.getvalue()}")
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+
+from . import dispatcher, sharding, users
+from .announcements import seen_cache, seen_cache_lock
+from .httpclient import BREAKER_STATES, breakers
+from .keyword_filters import filter_index
+from .messages import message_buffer
+from .metrics import metrics
+from .rendering import render_cache
+from .scheduler import POLL_MIN_INTERVAL, poll_states
+from .scraping import http_cache_lock, http_cache_stats
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics Export ---
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0)) # 0 disables the Prometheus endpoint
+metrics_server = None
+
+def collect_state_samples() -> list[tuple]:
+    # (name, type, labels, value) samples read from the state the bot already keeps
+    samples = []
+    with http_cache_lock:
+        for typ, stats in http_cache_stats.items():
+            for outcome, count in stats.items():
+                samples.append(('bot_http_cache_total', 'counter', (('outcome', outcome), ('source', typ)), count))
+    for typ, state in list(poll_states.items()):
+        samples.append(('bot_poll_interval_seconds', 'gauge', (('source', typ),), state.get('interval', POLL_MIN_INTERVAL)))
+        samples.append(('bot_poll_failures', 'gauge', (('source', typ),), state.get('failures', 0)))
+    for typ, breaker in list(breakers.items()):
+        samples.append(('bot_source_circuit_state', 'gauge', (('source', typ),), BREAKER_STATES[breaker.state]))
+        samples.append(('bot_source_fetch_failures', 'gauge', (('source', typ),), breaker.failures))
+    with seen_cache_lock:
+        for typ, cache in seen_cache.items():
+            samples.append(('bot_seen_cache_entries', 'gauge', (('source', typ),), len(cache)))
+    samples.append(('bot_render_cache_entries', 'gauge', (), len(render_cache)))
+    samples.append(('bot_registered_users', 'gauge', (), len(users.subscription_cache)))
+    for typ, source_filters in filter_index.items():
+        samples.append(('bot_filtered_users', 'gauge', (('source', typ),), len(source_filters.chats)))
+    samples.append(('bot_send_rate', 'gauge', (), dispatcher.send_bucket.rate))
+    if sharding.worker_pool:
+        samples.append(('bot_delivery_workers_alive', 'gauge', (), sharding.worker_pool.alive()))
+    samples.append(('bot_message_buffer_depth', 'gauge', (), message_buffer.stats['depth']))
+    samples.append(('bot_messages_dropped_total', 'counter', (), message_buffer.stats['dropped']))
+    return samples
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+def render_prometheus() -> str:
+    counters, histograms = metrics.snapshot()
+    samples = [(name, 'counter', labels, value) for (name, labels), value in counters.items()] + collect_state_samples()
+    lines = []
+    typed = set()
+    for name, kind, labels, value in sorted(samples, key=lambda sample: (sample[0], sample[2])):
+        if name not in typed:
+            lines.append(f"# TYPE {name} {kind}")
+            typed.add(name)
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        for bound, count in zip(metrics.buckets, histogram['buckets']):
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+        lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+        lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
+
+def metrics_summary_lines() -> list[str]:
+    # Short human readable version for the /metrics command
+    counters, histograms = metrics.snapshot()
+    describe = lambda name, labels: ' '.join([name, *(str(value) for _, value in labels)])
+    lines = []
+    for (name, labels), histogram in sorted(histograms.items()):
+        average = histogram['sum'] / histogram['count'] if histogram['count'] else 0
+        lines.append(f"{describe(name, labels)}: n={histogram['count']} avg={average * 1000:.1f}ms max={histogram['max'] * 1000:.1f}ms")
+    for name, _, labels, value in sorted(collect_state_samples(), key=lambda sample: (sample[0], sample[2])):
+        lines.append(f"{describe(name, labels)}: {value}")
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f"{describe(name, labels)}: {value}")
+    return lines
+
+async def handle_metrics_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # One request per connection: GET /metrics
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        if len(request_line) == 3 and request_line[0] == 'GET' and request_line[1].split('?', 1)[0] == '/metrics':
+            status, body = '200 OK', render_prometheus().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b''
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server():
+    global metrics_server
+    if METRICS_PORT and metrics_server is None:
+        metrics_server = await asyncio.start_server(handle_metrics_connection, METRICS_LISTEN, METRICS_PORT)
+        logger.info(f"Serving metrics on http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+
+async def stop_metrics_server():
+    global metrics_server
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+        metrics_server = None
@@ -0,0 +1,53 @@
+# Desktop notifications for whoever runs the bot (startup, new users). NOTIFIER picks the backend:
+# auto (a toast on Windows, the log elsewhere), toast, log or none.
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+NOTIFIER = os.getenv('NOTIFIER', 'auto')
+NOTIFICATION_TITLE = "The BOUN Announcements Bot"
+
+class LogNotifier:
+    def notify(self, title, message):
+        logger.info(f"{title}: {message}")
+
+class NullNotifier:
+    def notify(self, title, message):
+        pass
+
+class ToastNotifier:
+    # win10toast is Windows only, so it is imported here and not at module level
+    def __init__(self):
+        from win10toast import ToastNotifier as Toaster
+        self.toaster = Toaster()
+
+    def notify(self, title, message):
+        self.toaster.show_toast(title, message, duration=5, threaded=True)
+
+NOTIFIERS = {
+    'toast': ToastNotifier,
+    'log': LogNotifier,
+    'none': NullNotifier,
+}
+notifier = None # Created on first use
+
+def get_notifier():
+    global notifier
+    if notifier is None:
+        backend = NOTIFIER
+        if backend == 'auto':
+            backend = 'toast' if sys.platform == 'win32' else 'log'
+        if backend not in NOTIFIERS:
+            logger.warning(f"Unknown NOTIFIER={backend}, desktop notifications go to the log.")
+            backend = 'log'
+        try:
+            notifier = NOTIFIERS[backend]()
+        except ImportError:
+            logger.warning("win10toast is not installed, desktop notifications go to the log.")
+            notifier = LogNotifier()
+    return notifier
+
+def notify(message):
+    get_notifier().notify(NOTIFICATION_TITLE, message)
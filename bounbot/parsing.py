@@ -0,0 +1,76 @@
+import os
+from functools import lru_cache
+from importlib.util import find_spec
+
+# --- HTML Extraction ---
+# Optional faster parsers, BeautifulSoup with a SoupStrainer (a required dependency) is the fallback.
+# Every parser is imported when it is first used.
+HTML_BACKEND = os.getenv('HTML_BACKEND', 'auto') # auto, selectolax, lxml or bs4
+
+@lru_cache(maxsize=None)
+def available_backends() -> tuple:
+    # Looks the parsers up without importing them
+    backends = []
+    if find_spec('selectolax') and find_spec('selectolax.lexbor'):
+        backends.append('selectolax')
+    if find_spec('lxml') and find_spec('cssselect'):
+        backends.append('lxml')
+    if find_spec('bs4'):
+        backends.append('bs4')
+    return tuple(backends)
+
+def css_of(selector: dict) -> str:
+    # {'tag': 'td', 'class': 'views-field views-field-title'} -> 'td.views-field.views-field-title'
+    return selector['tag'] + ''.join(f".{cls}" for cls in selector['class'].split())
+
+def extract_with_selectolax(html: str, selector: dict) -> list:
+    from selectolax.lexbor import LexborHTMLParser
+    tree = LexborHTMLParser(html)
+    nodes = tree.css(css_of(selector))
+    if selector.get('first'):
+        nodes = [node.css_first(selector['first']) for node in nodes]
+    return [node.text(deep=True, separator='', strip=True) for node in nodes if node is not None]
+
+lxml_selectors = {} # Compiled CSSSelector objects, keyed by CSS string
+
+def extract_with_lxml(html: str, selector: dict) -> list:
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+    css = css_of(selector)
+    if css not in lxml_selectors:
+        lxml_selectors[css] = CSSSelector(css)
+    tree = lxml.html.document_fromstring(html.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+    nodes = lxml_selectors[css](tree)
+    if selector.get('first'):
+        nodes = [node.find(f".//{selector['first']}") for node in nodes]
+    return [''.join(text.strip() for text in node.xpath('.//text()')) for node in nodes if node is not None]
+
+def has_classes(classes: str):
+    # SoupStrainer sees the raw class attribute, match it by its individual classes
+    wanted = set(classes.split())
+    return lambda value: value is not None and wanted <= set(value.split() if isinstance(value, str) else value)
+
+def extract_with_bs4(html: str, selector: dict) -> list:
+    # Only the matching tags (and their children) are turned into a tree
+    from bs4 import BeautifulSoup as bs, SoupStrainer
+    strainer = SoupStrainer(selector['tag'], class_=has_classes(selector['class']))
+    soup = bs(html, 'html.parser', parse_only=strainer)
+    nodes = soup.find_all(selector['tag'], class_=selector['class'])
+    if selector.get('first'):
+        nodes = [node.find(selector['first']) for node in nodes]
+    return [node.get_text(strip=True) for node in nodes if node is not None]
+
+EXTRACTORS = {
+    'selectolax': extract_with_selectolax,
+    'lxml': extract_with_lxml,
+    'bs4': extract_with_bs4,
+}
+
+def extract_announcements(html: str, selector: dict, backend=None) -> list[str]:
+    # Texts of the elements described by `selector`, in page order, empty ones dropped
+    backend = backend or HTML_BACKEND
+    if backend == 'auto':
+        if not available_backends():
+            raise ImportError("No HTML parser is installed, install beautifulsoup4.")
+        backend = available_backends()[0]
+    return [text for text in EXTRACTORS[backend](html, selector) if text]
@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from .db import get_db, source_ids
+from .sources import SOURCES
+
+# --- Message Rendering ---
+TELEGRAM_MESSAGE_LIMIT = 4096
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', 256))
+MD_ESCAPE_TABLE = str.maketrans({char: f'\\{char}' for char in '\\_*[]()~`>#+-=|{}.!'})
+
+# Rendered (escaped and chunked) payloads, keyed by (kind, source, ...) with LRU eviction
+render_cache = OrderedDict()
+render_cache_lock = threading.Lock()
+# Source -> times its payloads were invalidated. A render that started before an invalidation is
+# returned but not stored, so it can't put a stale /latest back into the cache.
+render_generations = Counter()
+
+def escape_md(text):
+    return text.translate(MD_ESCAPE_TABLE)
+
+def split_message(header: str, lines: list[str], limit=TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    # Packs the lines into as few messages as possible under Telegram's length limit,
+    # the header only goes to the first one. Lines are never split unless one alone is too long.
+    chunks = []
+    current = header
+    for line in lines:
+        while len(line) > limit:
+            head = line[:limit]
+            trailing_backslashes = len(head) - len(head.rstrip('\\'))
+            cut = limit - 1 if trailing_backslashes % 2 else limit # Don't cut an escape sequence in half
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:cut])
+            line = line[cut:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+def render_generation(key):
+    # What invalidates the payload of `key`: its source for /latest, any source for /search
+    if key[0] == 'latest':
+        return render_generations[key[1]]
+    if key[0] == 'search':
+        return sum(render_generations.values())
+    return None # Payloads of fixed announcements never change
+
+def cached_render(key, render) -> list[str]:
+    with render_cache_lock:
+        if key in render_cache:
+            render_cache.move_to_end(key)
+            return render_cache[key]
+        generation = render_generation(key)
+    chunks = render()
+    with render_cache_lock:
+        if render_generation(key) == generation:
+            render_cache[key] = chunks
+            while len(render_cache) > RENDER_CACHE_SIZE:
+                render_cache.popitem(last=False)
+    return chunks
+
+def invalidate_rendered(typ):
+    # Drops the payloads that depend on the newest announcements of `typ` (/latest) and the
+    # search results, which can include them
+    with render_cache_lock:
+        render_generations[typ] += 1
+        for key in [key for key in render_cache if (key[0] == 'latest' and key[1] == typ) or key[0] == 'search']:
+            del render_cache[key]
+
+def render_announcement_lines(announcements) -> list[str]:
+    return [f"\\- {escape_md(ann.strip())}" for ann in announcements]
+
+def render_new_announcements(typ, announcements: list[str], key=None) -> list[str]:
+    # Notification for freshly found announcements. `key` identifies the batch (e.g. its id range).
+    def render():
+        header = f"*Yeni {escape_md(SOURCES[typ]['title'])} Duyuruları:*\n"
+        return split_message(header, render_announcement_lines(announcements))
+    return cached_render(('new', typ, key), render) if key is not None else render()
+
+def render_digest(batches: list[tuple[str, list[str]]], key=None) -> list[str]:
+    # One notification for several (source, announcements) batches, oldest batch first: a section per
+    # source in registry order, the newest announcements on top like in the single source message
+    def render():
+        sections = {}
+        for typ, announcements in reversed(batches):
+            sections.setdefault(typ, []).extend(announcements)
+        lines = []
+        for typ in SOURCES:
+            if typ in sections:
+                lines.append(f"\n*{escape_md(SOURCES[typ]['title'])}:*")
+                lines.extend(render_announcement_lines(sections[typ]))
+        return split_message("*Yeni Duyurular:*", lines)
+    return cached_render(('digest', key), render) if key is not None else render()
+
+def render_latest(typ, limit) -> list[str]:
+    # /latest payload of a source, [] when it has no announcements yet. Raises sqlite3.Error.
+    def render():
+        c = get_db().cursor()
+        c.execute("SELECT announcement FROM announcements WHERE source_id = ? ORDER BY id DESC LIMIT ?", (source_ids[typ], limit))
+        rows = c.fetchall()
+        if not rows:
+            return []
+        header = f"*{escape_md(SOURCES[typ]['name'])} duyurularındaki son {len(rows)} duyuru:*\n"
+        return split_message(header, render_announcement_lines(row[0] for row in rows))
+    return cached_render(('latest', typ, limit), render)
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from telegram.ext import ContextTypes, JobQueue
+
+from .announcements import diff_and_persist
+from .db import run_db
+from .dispatcher import OUTBOX_DRAIN_INTERVAL, drain_outbox
+from .httpclient import FETCH_TIMEOUT, get_breaker
+from .messages import MESSAGE_FLUSH_INTERVAL, message_buffer
+from .metrics import metrics, profile_requests, run_profiled
+from .scraping import commit_http_cache, fetch_announcements, http_cache_lock, http_cache_stats
+from .sharding import DELIVERY_WORKERS, WORKER_CHECK_INTERVAL, worker_pool
+from .sources import SOURCES, UNIVERSITY_TZ
+from .keyword_filters import check_filters
+from .users import SUBSCRIPTION_CHECK_INTERVAL, check_subscription_cache, process_removed_chats
+
+logger = logging.getLogger(__name__)
+
+# --- Polling Scheduler ---
+# Every source has its own job. The interval shrinks after a change and during working hours,
+# grows while the page stays the same and backs off exponentially on failures. While the circuit of
+# a source is open the job only wakes up for the breaker's probe.
+POLL_MIN_INTERVAL = int(os.getenv('POLL_MIN_INTERVAL', 600))
+POLL_MAX_INTERVAL = int(os.getenv('POLL_MAX_INTERVAL', 3 * 3600))
+POLL_WORKING_HOURS_MAX_INTERVAL = int(os.getenv('POLL_WORKING_HOURS_MAX_INTERVAL', 1800))
+POLL_GROWTH = 2.0 # Interval multiplier for every poll that finds nothing new
+POLL_JITTER = 0.1 # +-10%, keeps the sources from lining up
+WORKING_HOURS = range(8, 19) # Weekdays, university local time
+
+poll_states = {} # Source key -> {'interval': seconds, 'failures': n}
+
+def is_working_hours(now: datetime) -> bool:
+    local = now.astimezone(UNIVERSITY_TZ)
+    return local.weekday() < 5 and local.hour in WORKING_HOURS
+
+def next_poll_interval(state: dict, outcome: str, now: datetime) -> float:
+    # Updates `state` with the outcome of a poll ('changed', 'unchanged' or 'failed') and
+    # returns the seconds until the next one. Kept free of I/O so it can be replayed offline.
+    interval = state.get('interval', POLL_MIN_INTERVAL)
+    if outcome == 'failed':
+        state['failures'] = state.get('failures', 0) + 1
+        delay = min(POLL_MAX_INTERVAL, interval * 2 ** state['failures'])
+    else:
+        state['failures'] = 0
+        if outcome == 'changed':
+            interval = POLL_MIN_INTERVAL
+        else:
+            interval = min(POLL_MAX_INTERVAL, interval * POLL_GROWTH)
+        if is_working_hours(now):
+            interval = min(interval, POLL_WORKING_HOURS_MAX_INTERVAL)
+        state['interval'] = interval
+        delay = interval
+    return delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+async def check_source(typ) -> str:
+    # Fetches and diffs one source. Returns 'changed', 'unchanged', 'failed' or 'skipped' (circuit open).
+    breaker = get_breaker(typ)
+    if not breaker.allow():
+        logger.info(f"Skipping {typ.upper()}, its circuit is open for {breaker.retry_in():.0f}s more.")
+        return 'skipped'
+    try:
+        current = await asyncio.wait_for(fetch_announcements(typ), timeout=2 * FETCH_TIMEOUT + 5)
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        logger.error(f"Timed out fetching {typ.upper()} announcements.")
+        return 'failed'
+    except Exception as e:
+        logger.error(f"Unexpected error fetching {typ.upper()} announcements: {e}")
+        return 'failed'
+    if current is None:
+        logger.info(f"Skipping {typ.upper()}, the page did not change.")
+        return 'unchanged'
+    if not current:
+        return 'failed' # The pages always list announcements, an empty result is a fetch or parse error
+    try:
+        new_announcements = await run_db(diff_and_persist, typ, current)
+    except sqlite3.Error as e:
+        logger.error(f"Could not diff {typ.upper()} announcements: {e}")
+        return 'failed'
+    commit_http_cache(typ)
+    return 'changed' if new_announcements else 'unchanged'
+
+async def check_source_job(context: ContextTypes.DEFAULT_TYPE):
+    # The next check is only scheduled here, so it happens whatever this one raised
+    typ = context.job.data
+    logger.info(f"Running job: check_source_job for {typ.upper()}")
+    started = time.monotonic()
+    outcome = 'failed'
+    try:
+        if typ in profile_requests:
+            profile_requests.discard(typ)
+            outcome = await run_profiled(f"check_{typ}", check_source(typ))
+        else:
+            outcome = await check_source(typ)
+    except Exception as e:
+        logger.exception(f"Unexpected error checking {typ.upper()} announcements: {e}")
+        metrics.inc('bot_job_errors_total', job='check_source', source=typ)
+    finally:
+        metrics.observe('bot_phase_seconds', time.monotonic() - started, phase='cycle', source=typ)
+        metrics.inc('bot_polls_total', source=typ, outcome=outcome)
+        if outcome == 'skipped':
+            delay = get_breaker(typ).retry_in() + 1
+        else:
+            delay = next_poll_interval(poll_states.setdefault(typ, {}), outcome, datetime.now(timezone.utc))
+        context.job_queue.run_once(check_source_job, delay, data=typ, name=f"check_{typ}")
+    with http_cache_lock:
+        logger.info(f"HTTP cache stats for {typ.upper()}: {http_cache_stats.get(typ)}")
+    logger.info(f"Finished job: check_source_job for {typ.upper()} ({outcome}) in {time.monotonic() - started:.2f}s. "
+                f"Next check in {delay / 60:.1f} minutes.")
+
+def schedule_source_jobs(job_queue: JobQueue):
+    for i, typ in enumerate(SOURCES):
+        job_queue.run_once(check_source_job, 10 + 5 * i, data=typ, name=f"check_{typ}")
+    logger.info(f"Scheduled announcement check jobs for {len(SOURCES)} sources "
+                f"(every {POLL_MIN_INTERVAL // 60}-{POLL_MAX_INTERVAL // 60} minutes, adaptive).")
+
+async def drain_outbox_job(context: ContextTypes.DEFAULT_TYPE):
+    with metrics.timer('bot_phase_seconds', phase='drain', source='all'):
+        await drain_outbox(context.bot)
+
+async def check_workers_job(context: ContextTypes.DEFAULT_TYPE):
+    worker_pool.check()
+    try:
+        await run_db(process_removed_chats)
+    except sqlite3.Error as e:
+        logger.error(f"Database error deleting the chats removed by the delivery workers: {e}")
+
+async def flush_messages_job(context: ContextTypes.DEFAULT_TYPE):
+    await message_buffer.flush()
+
+async def check_subscription_cache_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await run_db(check_subscription_cache)
+        await run_db(check_filters)
+    except sqlite3.Error as e:
+        logger.error(f"Database error checking the subscription cache: {e}")
+
+def schedule_jobs(job_queue: JobQueue):
+    schedule_source_jobs(job_queue)
+
+    if DELIVERY_WORKERS:
+        # The delivery workers drain the outbox, the leader restarts the ones that died and deletes the chats they removed
+        job_queue.run_repeating(check_workers_job, interval=WORKER_CHECK_INTERVAL, name="check_workers")
+        logger.info(f"Outbox is drained by {DELIVERY_WORKERS} delivery workers.")
+    else:
+        job_queue.run_repeating(
+            drain_outbox_job,
+            interval=OUTBOX_DRAIN_INTERVAL,
+            first=5, # Resumes deliveries interrupted by a restart
+            name="drain_outbox"
+        )
+        logger.info(f"Scheduled outbox drain job (every {OUTBOX_DRAIN_INTERVAL}s).")
+
+    job_queue.run_repeating(
+        check_subscription_cache_job,
+        interval=SUBSCRIPTION_CHECK_INTERVAL,
+        first=SUBSCRIPTION_CHECK_INTERVAL,
+        name="check_subscription_cache"
+    )
+    job_queue.run_repeating(flush_messages_job, interval=MESSAGE_FLUSH_INTERVAL, name="flush_messages")
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+from .httpclient import get_breaker, get_with_retries
+from .metrics import metrics
+from .parsing import extract_announcements
+from .sources import SOURCES
+
+logger = logging.getLogger(__name__)
+
+FETCH_MAX_WORKERS = int(os.getenv('FETCH_MAX_WORKERS', 4)) # How many sources are fetched at the same time
+fetch_semaphore = asyncio.Semaphore(FETCH_MAX_WORKERS)
+
+# --- Scraping Functions ---
+# Per-source HTTP validators and body hash of the last page whose announcements were diffed. A changed
+# page's validators wait in pending_http_cache until check_source has diffed it, so a parse error, an
+# empty result, a timeout or a DB error makes the next poll fetch and diff the page again.
+http_cache = {}
+pending_http_cache = {}
+http_cache_stats = {} # Source key -> {'not_modified': n, 'unchanged': n, 'changed': n}
+http_cache_lock = threading.Lock()
+
+def count_http_cache(typ, outcome):
+    with http_cache_lock:
+        stats = http_cache_stats.setdefault(typ, {'not_modified': 0, 'unchanged': 0, 'changed': 0})
+        stats[outcome] += 1
+
+async def fetch_page(typ) -> Optional[str]:
+    # Returns the page HTML, or None when it did not change since the last fetch. Sends the
+    # server's validators (conditional GET) and falls back to comparing a hash of the body,
+    # so unchanged pages skip parsing and DB diffing. Request errors (after retries) are raised to the caller.
+    url = SOURCES[typ]['url']
+    pending_http_cache.pop(typ, None)
+    cached = http_cache.get(typ, {})
+    request_headers = {}
+    if cached.get('etag'):
+        request_headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        request_headers['If-Modified-Since'] = cached['last_modified']
+
+    response = await get_with_retries(url, typ, headers=request_headers)
+    if response.status_code == 304:
+        count_http_cache(typ, 'not_modified')
+        logger.info(f"{typ.upper()} page not modified (304).")
+        return None
+    response.raise_for_status()
+    metrics.inc('bot_fetched_bytes_total', len(response.content), source=typ)
+
+    body_hash = hashlib.sha256(response.content).hexdigest()
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'hash': body_hash,
+    }
+    if body_hash == cached.get('hash'):
+        http_cache[typ] = validators # Same page as the diffed one, only the validators can be new
+        count_http_cache(typ, 'unchanged')
+        logger.info(f"{typ.upper()} page content unchanged.")
+        return None
+    pending_http_cache[typ] = validators
+    count_http_cache(typ, 'changed')
+    response.encoding = 'utf-8'
+    return response.text
+
+def commit_http_cache(typ):
+    # Called once the announcements of the fetched page are persisted
+    validators = pending_http_cache.pop(typ, None)
+    if validators is not None:
+        http_cache[typ] = validators
+
+async def fetch_announcements(typ) -> Optional[list[str]]:
+    # Request errors count against the source's circuit breaker, parse errors do not
+    url = SOURCES[typ]['url']
+    breaker = get_breaker(typ)
+    announcements = []
+    try:
+        async with fetch_semaphore:
+            with metrics.timer('bot_phase_seconds', phase='fetch', source=typ):
+                html = await fetch_page(typ)
+        breaker.record_success()
+        if html is None:
+            return None
+        # Parsing is CPU bound, keep it off the event loop
+        with metrics.timer('bot_phase_seconds', phase='parse', source=typ):
+            announcements = await asyncio.to_thread(extract_announcements, html, SOURCES[typ]['selector'])
+        metrics.inc('bot_parsed_items_total', len(announcements), source=typ)
+        
+        logger.info(f"Fetched {len(announcements)} {typ.upper()} announcements from {url} in order.")
+        return announcements
+    except httpx.TimeoutException:
+        breaker.record_failure()
+        logger.error(f"Timeout error fetching {typ.upper()} announcements from {url}")
+        return []
+    except httpx.HTTPError as e:
+        breaker.record_failure()
+        logger.error(f"Failed to fetch {typ.upper()} announcements: {e}")
+        return []
+    except Exception as e:
+        logger.error(f"Error parsing {typ.upper()} announcements HTML: {e}")
+        return []
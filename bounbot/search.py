@@ -0,0 +1,55 @@
+import os
+import re
+
+from .db import fold_turkish, get_db
+from .metrics import metrics
+from .rendering import cached_render, escape_md, split_message
+from .sources import SOURCES
+
+# --- Announcement Search ---
+# /search runs on the announcements_fts index (see db.create_search_index). Queries are folded like
+# the index and every word has to match, as a prefix from 3 letters on ("sinav" finds "sınavı";
+# shorter prefixes would expand to half the index). Results are ranked with bm25, newest first on
+# ties. Rendered pages go through the render cache, which drops them whenever announcements are saved.
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 5))
+SEARCH_MAX_TERMS = 8
+SEARCH_MIN_PREFIX = 3
+SEARCH_TERM_PATTERN = re.compile(r'\w+')
+
+def search_terms(query: str) -> tuple[str, ...]:
+    return tuple(dict.fromkeys(SEARCH_TERM_PATTERN.findall(fold_turkish(query))))[:SEARCH_MAX_TERMS]
+
+def search_announcements(terms: tuple[str, ...], page: int) -> tuple[list[tuple[str, str]], bool]:
+    # One page of (source key, announcement) matches and whether there is a next one. Raises sqlite3.Error.
+    match = ' '.join(f'"{term}"*' if len(term) >= SEARCH_MIN_PREFIX else f'"{term}"' for term in terms)
+    c = get_db().cursor()
+    # The page is ranked and cut inside the index before the texts are joined in
+    c.execute("""
+        SELECT s.key, a.announcement
+        FROM (SELECT rowid, rank FROM announcements_fts WHERE announcements_fts MATCH ?
+              ORDER BY rank, rowid DESC LIMIT ? OFFSET ?) f
+        JOIN announcements a ON a.id = f.rowid
+        JOIN sources s ON s.id = a.source_id
+        ORDER BY f.rank, f.rowid DESC
+    """, (match, SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE))
+    rows = c.fetchall()
+    return rows[:SEARCH_PAGE_SIZE], len(rows) > SEARCH_PAGE_SIZE
+
+def render_search(query: str, page: int) -> tuple[list[str], bool]:
+    # /search payload for one page, ([], False) when nothing matches. Raises sqlite3.Error.
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+
+    def render():
+        with metrics.timer('bot_phase_seconds', phase='search', source='all'):
+            rows, has_more = search_announcements(terms, page)
+        if not rows:
+            return [], False
+        header = f"*\"{escape_md(' '.join(terms))}\" için sonuçlar \\(sayfa {page}\\):*\n"
+        lines = [f"\\- _{escape_md(SOURCES[typ]['name'] if typ in SOURCES else typ)}:_ {escape_md(announcement.strip())}"
+                 for typ, announcement in rows]
+        if has_more:
+            lines.append("\nDaha fazla sonuç için /more")
+        return split_message(header, lines), has_more
+    return cached_render(('search', terms, page), render)
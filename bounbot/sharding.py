@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+from . import db
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Sharded Delivery ---
+# With DELIVERY_WORKERS=N the process holding the leader lock only scrapes and queues notifications
+# in the outbox (the queue between the two sides). N worker processes deliver them, each one owning
+# the chats with abs(chat_id) % N == its index and sending at 1/N of the global Telegram rate.
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 0)) # 0: the leader delivers on its own event loop
+WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 2)) # Seconds between two drains of a worker
+WORKER_CHECK_INTERVAL = 30 # Seconds between two checks for dead workers and removed chats
+
+def lock_path() -> str:
+    return os.getenv('LEADER_LOCK_PATH') or f"{db.db_path}.leader.lock"
+
+def pause_path() -> str:
+    return f"{db.db_path}.send-pause"
+
+def shard_of(chat_id, count: int) -> int:
+    return abs(chat_id) % count
+
+class LeaderLock:
+    # Exclusive, non-blocking lock on a file next to the database. The OS drops it when the
+    # process exits, so a crashed leader never leaves a stale lock behind.
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def acquire(self) -> bool:
+        self.file = open(self.path, 'a+')
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+        return True
+
+    def holder(self) -> str:
+        try:
+            with open(self.path) as f:
+                return f.read().strip() or '?'
+        except OSError:
+            return '?'
+
+    def release(self):
+        if self.file is None:
+            return
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+def setup_worker(index: int, count: int):
+    # Per-process state of a delivery worker; the leader has already created and migrated the DB
+    from . import dispatcher, users
+    db.source_ids.update(db.get_db().execute("SELECT key, id FROM sources"))
+    dispatcher.send_bucket = dispatcher.SharedTokenBucket(dispatcher.TELEGRAM_GLOBAL_RATE / count, pause_path())
+    dispatcher.remove_chat = users.queue_chat_removal
+
+async def run_worker(index: int, count: int, parent_pid: int):
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+    from . import dispatcher
+
+    setup_worker(index, count)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError: # Windows, the leader terminates the process instead
+            pass
+
+    bot = Bot(os.getenv('TELEGRAM_BOT_TOKEN'), request=HTTPXRequest(connection_pool_size=dispatcher.SEND_CONCURRENCY))
+    async with bot:
+        logger.info(f"Delivery worker {index}/{count} started.")
+        while not stopping.is_set():
+            if os.getppid() != parent_pid:
+                logger.warning(f"Delivery worker {index}/{count} lost its leader, stopping.")
+                break
+            with metrics.timer('bot_phase_seconds', phase='drain', source=f'shard{index}'):
+                await dispatcher.drain_outbox(bot, (index, count))
+            try:
+                await asyncio.wait_for(stopping.wait(), WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    db.db_executor.shutdown(wait=True)
+    logger.info(f"Delivery worker {index}/{count} stopped.")
+
+def worker_main(index: int, count: int, parent_pid: int):
+    from .app import configure_logging
+    configure_logging()
+    try:
+        asyncio.run(run_worker(index, count, parent_pid))
+    except KeyboardInterrupt:
+        pass
+
+class WorkerPool:
+    # Starts the delivery workers as fresh interpreters ('spawn' works the same on every OS)
+    # and restarts the ones that died
+    def __init__(self, count: int):
+        self.count = count
+        self.processes = {}
+        self.context = multiprocessing.get_context('spawn')
+
+    def spawn(self, index: int):
+        process = self.context.Process(target=worker_main, args=(index, self.count, os.getpid()),
+                                       name=f"delivery-{index}", daemon=True)
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        from .dispatcher import TELEGRAM_GLOBAL_RATE
+        for index in range(self.count):
+            self.spawn(index)
+        logger.info(f"Started {self.count} delivery workers "
+                    f"({TELEGRAM_GLOBAL_RATE / self.count:.1f} msg/s each).")
+
+    def check(self):
+        for index, process in list(self.processes.items()):
+            if not process.is_alive():
+                logger.warning(f"Delivery worker {index} exited with code {process.exitcode}, restarting it.")
+                metrics.inc('bot_worker_restarts_total', shard=index)
+                self.spawn(index)
+
+    def alive(self) -> int:
+        return sum(1 for process in self.processes.values() if process.is_alive())
+
+    def stop(self, timeout: float = 10):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+        self.processes.clear()
+
+worker_pool = WorkerPool(DELIVERY_WORKERS) if DELIVERY_WORKERS else None
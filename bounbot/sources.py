@@ -0,0 +1,27 @@
+from datetime import timedelta, timezone
+
+# Every source the bot follows. The source rows, /subscribe_<key> and /unsubscribe_<key> commands
+# and the fetch jobs are all generated from this registry. `selector` describes the announcement
+# elements: every `tag` with the `class` attribute, or the `first` matching descendant of each.
+SOURCES = {
+    'main': {
+        'name': 'Ana sayfa',
+        'title': 'Ana Sayfa',
+        'url': 'https://bogazici.edu.tr/tr-TR/Content/Duyurular/Duyurular',
+        'selector': {'tag': 'a', 'class': 'urltoGO'},
+    },
+    'yadyok': {
+        'name': 'YADYOK',
+        'title': 'YADYOK',
+        'url': 'https://yadyok.bogazici.edu.tr/tr/duyurular',
+        'selector': {'tag': 'span', 'class': 'field-content'},
+    },
+    'mis': {
+        'name': 'MIS',
+        'title': 'MIS',
+        'url': 'https://mis.bogazici.edu.tr/tr/latest-news',
+        'selector': {'tag': 'td', 'class': 'views-field views-field-title', 'first': 'a'},
+    },
+}
+
+UNIVERSITY_TZ = timezone(timedelta(hours=3)) # Türkiye is on UTC+3 all year, used for working hours and digests
@@ -0,0 +1,274 @@
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from .db import db_lock, delete_finished_batches, get_db, source_ids
+from .keyword_filters import forget_chat
+from .notifier import notify
+from .sources import SOURCES, UNIVERSITY_TZ
+
+logger = logging.getLogger(__name__)
+
+### --- Subscription Cache ---
+# Process-wide copy of the subscriptions: chat id -> bitmask with one bit per source (see source_bit).
+# Every registered chat has an entry, even with no subscriptions left. It is loaded at startup,
+# updated by the writers below while they still hold db_lock (write-through) and checked
+# against the DB by a periodic job, so commands and fan-out never have to query SQLite for it.
+subscription_cache = {}
+SUBSCRIPTION_CHECK_INTERVAL = int(os.getenv('SUBSCRIPTION_CHECK_INTERVAL', 3600))
+
+def source_bit(typ) -> int:
+    return 1 << list(SOURCES).index(typ)
+
+def all_sources_mask() -> int:
+    return (1 << len(SOURCES)) - 1
+
+def read_subscriptions(c: sqlite3.Cursor) -> dict:
+    bits = {source_ids[key]: source_bit(key) for key in SOURCES}
+    subscriptions = dict.fromkeys((row[0] for row in c.execute("SELECT id FROM chat_ids")), 0)
+    for chat_id, source_id in c.execute("SELECT chat_id, source_id FROM subscriptions"):
+        if chat_id in subscriptions:
+            subscriptions[chat_id] |= bits.get(source_id, 0)
+    return subscriptions
+
+def subscription_cache_bytes() -> int:
+    # Dict table plus the chat id keys; the masks are small ints CPython shares
+    return sys.getsizeof(subscription_cache) + sum(sys.getsizeof(chat_id) for chat_id in subscription_cache)
+
+def load_subscription_cache():
+    global subscription_cache
+    with get_db() as conn:
+        subscription_cache = read_subscriptions(conn.cursor())
+        load_digest_modes(conn.cursor())
+    users = len(subscription_cache)
+    size = subscription_cache_bytes()
+    per_100k = size / users * 100_000 / 1024 / 1024 if users else 0
+    logger.info(f"Loaded subscriptions of {users} users into memory ({size / 1024:.0f} KB, ~{per_100k:.1f} MB per 100k users).")
+
+def check_subscription_cache() -> int:
+    # Compares the cache (and the digest modes) with the DB and repairs it. Holding db_lock keeps writers
+    # (and their write-through updates) out while both sides are read. Returns the number of differing chats.
+    global subscription_cache
+    with db_lock:
+        with get_db() as conn:
+            stored = read_subscriptions(conn.cursor())
+            stored_modes = dict(conn.execute("SELECT id, digest FROM chat_ids WHERE digest != 'instant'"))
+        cached = subscription_cache
+        mismatches = sum(1 for chat_id in stored.keys() | cached.keys() if stored.get(chat_id) != cached.get(chat_id))
+        if mismatches:
+            logger.warning(f"Subscription cache differed from the DB for {mismatches} chats, reloaded it.")
+            subscription_cache = stored
+        mode_mismatches = sum(1 for chat_id in stored_modes.keys() | digest_modes.keys() if stored_modes.get(chat_id) != digest_modes.get(chat_id))
+        if mode_mismatches:
+            logger.warning(f"Digest modes differed from the DB for {mode_mismatches} chats, reloaded them.")
+            digest_modes.clear()
+            digest_modes.update(stored_modes)
+    return mismatches + mode_mismatches
+
+### --- Digest Mode ---
+# Chats can get their notifications bundled once an hour or once a day instead of right away.
+# Their outbox rows are queued for the end of the window; the drain merges every due row of a
+# chat into one message either way.
+DIGEST_MODES = ('instant', 'hourly', 'daily')
+DIGEST_DAILY_HOUR = int(os.getenv('DIGEST_DAILY_HOUR', 9)) # University local time
+digest_modes = {} # Chat id -> 'hourly' or 'daily', instant chats are left out
+
+def load_digest_modes(c: sqlite3.Cursor):
+    digest_modes.clear()
+    digest_modes.update(c.execute("SELECT id, digest FROM chat_ids WHERE digest != 'instant'"))
+
+def digest_due_times(now: float) -> dict:
+    # {mode: when its current window closes} for queueing notifications at `now`
+    local = datetime.fromtimestamp(now, UNIVERSITY_TZ)
+    next_hour = local.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    next_day = local.replace(hour=DIGEST_DAILY_HOUR, minute=0, second=0, microsecond=0)
+    if next_day <= local:
+        next_day += timedelta(days=1)
+    return {'instant': now, 'hourly': next_hour.timestamp(), 'daily': next_day.timestamp()}
+
+def get_digest_mode(chat_id) -> str:
+    return digest_modes.get(chat_id, 'instant')
+
+def set_digest_mode(chat_id, mode) -> bool:
+    # Stores the mode and moves the chat's pending notifications to the end of the new window
+    if chat_id not in subscription_cache:
+        logger.warning(f"Chat ID {chat_id} not found for digest mode.")
+        return False
+    with db_lock:
+        try:
+            with get_db() as conn:
+                c = conn.cursor()
+                c.execute("UPDATE chat_ids SET digest = ? WHERE id = ?", (mode, chat_id))
+                c.execute("UPDATE outbox SET next_attempt_at = ? WHERE chat_id = ? AND attempts = 0",
+                          (digest_due_times(time.time())[mode], chat_id))
+                conn.commit()
+                if mode == 'instant':
+                    digest_modes.pop(chat_id, None)
+                else:
+                    digest_modes[chat_id] = mode
+                logger.info(f"Chat ID {chat_id} switched to {mode} notifications.")
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Database error setting the digest mode of chat ID {chat_id}: {e}")
+            return False
+
+def save_chat_id(user) -> bool:
+    chat_id = user.id
+    if not chat_id:
+        logger.warning("No chat ID found in user object.")
+        return False
+    
+    with db_lock:
+        try:
+            with get_db() as conn:
+                c = conn.cursor()
+                # An upsert, so /start again keeps the digest mode
+                c.execute("""
+                    INSERT INTO chat_ids (id, first_name, last_name, username)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET first_name = excluded.first_name,
+                        last_name = excluded.last_name, username = excluded.username
+                    """, (
+                    user.id,
+                    user.first_name,
+                    user.last_name,
+                    user.username
+                ))
+                # New users (and /start again) are subscribed to every source
+                c.execute("INSERT OR IGNORE INTO subscriptions (chat_id, source_id) SELECT ?, id FROM sources", (chat_id,))
+                c.execute("DELETE FROM removed_chats WHERE chat_id = ?", (chat_id,)) # Back before the leader got to it
+                conn.commit()
+                subscription_cache[chat_id] = all_sources_mask()
+                notify(f"New user: {user.first_name}")
+                
+                logger.info(f"Attempted to save chat ID {chat_id}.")
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Database error saving chat ID {chat_id}: {e}")
+            return False
+
+def delete_chat_outbox(c: sqlite3.Cursor, chat_id):
+    batch_ids = {row[0] for row in c.execute("SELECT batch_id FROM outbox WHERE chat_id = ?", (chat_id,))}
+    c.execute("DELETE FROM outbox WHERE chat_id = ?", (chat_id,))
+    delete_finished_batches(c, batch_ids)
+
+def delete_chat_rows(c: sqlite3.Cursor, chat_id) -> bool:
+    c.execute("DELETE FROM chat_ids WHERE id = ?", (chat_id,))
+    deleted = c.rowcount > 0
+    c.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+    c.execute("DELETE FROM filters WHERE chat_id = ?", (chat_id,))
+    delete_chat_outbox(c, chat_id)
+    c.execute("DELETE FROM removed_chats WHERE chat_id = ?", (chat_id,))
+    return deleted
+
+def forget_chat_caches(chat_id):
+    subscription_cache.pop(chat_id, None)
+    digest_modes.pop(chat_id, None)
+    forget_chat(chat_id)
+
+def delete_chat_id(chat_id) -> bool:
+    with db_lock:
+        try:
+            with get_db() as conn:
+                deleted = delete_chat_rows(conn.cursor(), chat_id)
+                conn.commit()
+                forget_chat_caches(chat_id)
+                if deleted:
+                    logger.info(f"Chat ID {chat_id} deleted.")
+                    return True
+                else:
+                    logger.warning(f"Chat ID {chat_id} not found for deletion.")
+                    return False
+        except sqlite3.Error as e:
+            logger.error(f"Database error deleting chat ID {chat_id}: {e}")
+            return False
+
+def queue_chat_removal(chat_id) -> bool:
+    # delete_chat_id for delivery workers: the caches belong to the leader, so a worker only stops
+    # delivering to the chat and leaves the deletion to process_removed_chats
+    with db_lock:
+        try:
+            with get_db() as conn:
+                conn.execute("INSERT OR REPLACE INTO removed_chats (chat_id, removed_at) VALUES (?, ?)", (chat_id, time.time()))
+                delete_chat_outbox(conn.cursor(), chat_id)
+                conn.commit()
+                logger.info(f"Chat ID {chat_id} queued for removal.")
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Database error queueing chat ID {chat_id} for removal: {e}")
+            return False
+
+def process_removed_chats() -> int:
+    # Deletes the chats queued by the delivery workers, rows and caches. /start in the meantime
+    # takes the chat off the queue (save_chat_id). Returns the number of chats. Raises sqlite3.Error.
+    with db_lock:
+        with get_db() as conn:
+            c = conn.cursor()
+            chat_ids = [row[0] for row in c.execute("SELECT chat_id FROM removed_chats")]
+            for chat_id in chat_ids:
+                delete_chat_rows(c, chat_id)
+            conn.commit()
+            for chat_id in chat_ids:
+                forget_chat_caches(chat_id)
+    if chat_ids:
+        logger.info(f"Deleted {len(chat_ids)} chats removed by the delivery workers.")
+    return len(chat_ids)
+
+SUBSCRIBER_CHUNK_SIZE = 1000
+
+def iter_subscriber_ids(typ, chunk_size=SUBSCRIBER_CHUNK_SIZE, skip=frozenset()):
+    # Yields the subscribers of `typ` (except the ones in `skip`) from the subscription cache in sorted chunks of chat ids
+    bit = source_bit(typ)
+    chat_ids = sorted(chat_id for chat_id, mask in list(subscription_cache.items()) if mask & bit and chat_id not in skip)
+    for start in range(0, len(chat_ids), chunk_size):
+        yield chat_ids[start:start + chunk_size]
+
+def subscribed_among(typ, chat_ids) -> list:
+    bit = source_bit(typ)
+    return [chat_id for chat_id in chat_ids if subscription_cache.get(chat_id, 0) & bit]
+
+def get_user_subscriptions(chat_id) -> dict:
+    # {source key: 1/0} for every source, or {} when the chat is not registered. Memory only.
+    mask = subscription_cache.get(chat_id)
+    if mask is None:
+        logger.warning(f"Chat ID {chat_id} not found for subscription check.")
+        return {}
+    return {key: int(bool(mask & source_bit(key))) for key in SOURCES}
+
+def subscribe(chat_id, typ) -> bool:
+    if chat_id not in subscription_cache:
+        logger.warning(f"Chat ID {chat_id} not found for subscription.")
+        return False
+    with db_lock:
+        try:
+            with get_db() as conn:
+                c = conn.cursor()
+                c.execute("INSERT OR IGNORE INTO subscriptions (chat_id, source_id) VALUES (?, ?)", (chat_id, source_ids[typ]))
+                conn.commit()
+                subscription_cache[chat_id] = subscription_cache.get(chat_id, 0) | source_bit(typ)
+                logger.info(f"Chat ID {chat_id} subscribed to {typ}.")
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Database error subscribing chat ID {chat_id}: {e}")
+            return False
+
+def unsubscribe(chat_id, typ) -> bool:
+    if chat_id not in subscription_cache:
+        logger.warning(f"Chat ID {chat_id} not found for unsubscription.")
+        return False
+    with db_lock:
+        try:
+            with get_db() as conn:
+                c = conn.cursor()
+                c.execute("DELETE FROM subscriptions WHERE chat_id = ? AND source_id = ?", (chat_id, source_ids[typ]))
+                conn.commit()
+                if chat_id in subscription_cache:
+                    subscription_cache[chat_id] &= ~source_bit(typ)
+                logger.info(f"Chat ID {chat_id} unsubscribed from {typ}.")
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Database error unsubscribing chat ID {chat_id}: {e}")
+            return False
@@ -0,0 +1,148 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+from functools import partial
+
+from telegram import Update
+from telegram.ext import Application
+
+from .handlers import COMMAND_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# --- Webhook Server ---
+# Set WEBHOOK_URL to receive updates over HTTP instead of long polling. Telegram only talks
+# HTTPS, so the server is meant to sit behind a TLS-terminating reverse proxy.
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') # Public URL Telegram posts to, e.g. https://bot.example.com/telegram
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token. Without one a random secret is generated at every
+# start; it is registered with set_webhook, so only Telegram knows it.
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000)) # Updates waiting for a handler
+WEBHOOK_MAX_BODY = 1024 * 1024
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+                405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+def webhook_status(application: Application, updates: asyncio.Queue, method, path, request_headers, body) -> int:
+    if path.split('?', 1)[0] != WEBHOOK_PATH:
+        return 404
+    if method != 'POST':
+        return 405
+    token = request_headers.get('x-telegram-bot-api-secret-token', '')
+    if not hmac.compare_digest(token.encode('latin-1'), WEBHOOK_SECRET.encode('latin-1')):
+        return 403
+    try:
+        data = json.loads(body)
+        if not isinstance(data, dict):
+            raise ValueError("update is not a JSON object")
+        update = Update.de_json(data, application.bot)
+    except (ValueError, TypeError, KeyError) as e:
+        logger.warning(f"Rejected malformed webhook payload: {e}")
+        return 400
+    try:
+        updates.put_nowait(update)
+    except asyncio.QueueFull:
+        # Telegram keeps the update and retries later, so a full queue just slows it down
+        logger.warning("Webhook queue is full, asking Telegram to retry.")
+        return 503
+    return 200
+
+async def handle_webhook_connection(application: Application, updates: asyncio.Queue,
+                                    reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # Minimal HTTP/1.1: request line, headers and a Content-Length body, with keep-alive
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                break
+            method, path, _ = parts
+            request_headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                request_headers[name.strip().lower()] = value.strip()
+
+            length = int(request_headers.get('content-length', 0) or 0)
+            if length > WEBHOOK_MAX_BODY:
+                status, keep_alive = 413, False
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status = webhook_status(application, updates, method, path, request_headers, body)
+                keep_alive = request_headers.get('connection', '').lower() != 'close'
+
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                f"Content-Length: 0\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def process_webhook_updates(application: Application, updates: asyncio.Queue):
+    # A fixed pool of these feeds the regular handlers, so at most COMMAND_CONCURRENCY run at once
+    while True:
+        update = await updates.get()
+        try:
+            await application.process_update(update)
+        except Exception as e:
+            logger.error(f"Error processing webhook update: {e}")
+        finally:
+            updates.task_done()
+
+async def run_webhook(application: Application):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+
+    updates = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start() # Starts the job queue
+    workers = [asyncio.create_task(process_webhook_updates(application, updates))
+               for _ in range(COMMAND_CONCURRENCY)]
+    server = await asyncio.start_server(
+        partial(handle_webhook_connection, application, updates), WEBHOOK_LISTEN, WEBHOOK_PORT
+    )
+    try:
+        await application.bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=min(100, COMMAND_CONCURRENCY)
+        )
+        logger.info(f"Webhook server listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}.")
+        await stop_event.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        try:
+            await asyncio.wait_for(updates.join(), timeout=10) # Let accepted updates finish
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {updates.qsize()} unprocessed webhook updates.")
+        for worker in workers:
+            worker.cancel()
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
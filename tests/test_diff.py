@@ -0,0 +1,116 @@
+# Diff stage (announcements.diff_and_persist) on the saved pages in bench/fixtures, each test
+# on a fresh database in a temporary directory.
+#
+#   python -m unittest discover tests
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(ROOT, 'bench', 'fixtures')
+sys.path.insert(0, ROOT)
+
+from bounbot import announcements, db, parsing, rendering, users
+from bounbot.sources import SOURCES
+
+def load_page(typ) -> list[str]:
+    with open(os.path.join(FIXTURE_DIR, f'{typ}.html'), encoding='utf-8') as f:
+        return parsing.extract_announcements(f.read(), SOURCES[typ]['selector'])
+
+class DiffTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.reset_db(os.path.join(self.tmp, 'test.db'))
+        db.init_db()
+        announcements.seen_cache.clear()
+        rendering.render_cache.clear()
+        users.load_subscription_cache()
+
+    def tearDown(self):
+        self.reset_db(db.db_path)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def reset_db(self, path):
+        conn = getattr(db.db_local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        db.db_local.conn = None
+        db.db_path = path
+
+    def stored(self, typ) -> list[tuple[int, str]]:
+        return db.get_db().execute("SELECT id, announcement FROM announcements WHERE source_id = ? ORDER BY id",
+                                   (db.source_ids[typ],)).fetchall()
+
+    def test_fixture_pages_are_stored_in_site_order(self):
+        for typ in SOURCES:
+            page = load_page(typ)
+            self.assertTrue(page, f"no announcements parsed from the {typ} fixture")
+            saved = announcements.diff_and_persist(typ, page)
+            expected = list(dict.fromkeys(ann.strip() for ann in page if ann.strip()))
+            self.assertEqual([ann for _, ann in saved], expected)
+            ids = [announcement_id for announcement_id, _ in saved]
+            # Newest first on the page, so the ids go down and the oldest item has the lowest one
+            self.assertEqual(ids, sorted(ids, reverse=True))
+            self.assertEqual(ids[-1], min(announcement_id for announcement_id, _ in self.stored(typ)))
+            self.assertEqual(len(self.stored(typ)), len(expected))
+
+    def test_page_is_deduped(self):
+        page = load_page('main')
+        noisy = [page[0], f"  {page[0]}  ", page[1], '', '   ', page[0], *page[1:]]
+        saved = announcements.diff_and_persist('main', noisy)
+        self.assertEqual([ann for _, ann in saved], list(dict.fromkeys(ann.strip() for ann in page)))
+        self.assertEqual(len({ann for _, ann in self.stored('main')}), len(self.stored('main')))
+
+    def test_repoll_returns_nothing(self):
+        page = load_page('yadyok')
+        self.assertTrue(announcements.diff_and_persist('yadyok', page))
+        self.assertEqual(announcements.diff_and_persist('yadyok', page), [])
+        # Without the seen cache the DB lookup has to answer the same
+        announcements.seen_cache.clear()
+        self.assertEqual(announcements.diff_and_persist('yadyok', page), [])
+
+    def test_new_items_on_top_get_higher_ids(self):
+        page = load_page('mis')
+        first = announcements.diff_and_persist('mis', page)
+        fresh = ["Yeni duyuru 2 (test).", "Yeni duyuru 1 (test)."]
+        saved = announcements.diff_and_persist('mis', fresh + page[:-1])
+        self.assertEqual([ann for _, ann in saved], fresh)
+        self.assertGreater(saved[0][0], saved[1][0])
+        self.assertGreater(saved[1][0], max(announcement_id for announcement_id, _ in first))
+
+    def test_new_announcements_are_queued_once_per_subscriber(self):
+        chat_ids = [1001, 1002, 1003]
+        with db.get_db() as conn:
+            conn.executemany("INSERT INTO chat_ids (id) VALUES (?)", [(chat_id,) for chat_id in chat_ids])
+            conn.executemany("INSERT INTO subscriptions (chat_id, source_id) VALUES (?, ?)",
+                             [(chat_id, db.source_ids['main']) for chat_id in chat_ids])
+            conn.commit()
+        users.load_subscription_cache()
+        saved = announcements.diff_and_persist('main', load_page('main'))
+        batches = db.get_db().execute("SELECT first_id, last_id FROM outbox_batches").fetchall()
+        self.assertEqual(batches, [(min(i for i, _ in saved), max(i for i, _ in saved))])
+        queued = db.get_db().execute("SELECT chat_id FROM outbox ORDER BY chat_id").fetchall()
+        self.assertEqual([row[0] for row in queued], chat_ids)
+
+    def test_batch_insert_is_one_transaction(self):
+        # One executemany in one transaction, however long the page; the insert rate is measured by the bench
+        page = [f"Toplu duyuru {i} (test)." for i in range(2_000, 0, -1)]
+        conn = db.get_db()
+        statements = []
+        changes = conn.total_changes
+        conn.set_trace_callback(statements.append)
+        try:
+            saved = announcements.diff_and_persist('main', page)
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual([ann for _, ann in saved], page)
+        self.assertEqual(saved[-1][0], min(announcement_id for announcement_id, _ in saved))
+        self.assertEqual([statement.split()[0] for statement in statements if statement.split()[0] in ('BEGIN', 'COMMIT')],
+                         ['BEGIN', 'COMMIT'])
+        self.assertGreaterEqual(conn.total_changes - changes, len(page))
+
+if __name__ == '__main__':
+    unittest.main()
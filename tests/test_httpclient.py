@@ -0,0 +1,117 @@
+# Fetching through bounbot.httpclient against the local stub hosts of bench/fakes.py: redirects,
+# retries of 503 answers with and without Retry-After, and the per-source circuit breaker.
+#
+#   python -m unittest discover tests
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from fakes import StubServer, load_fixtures
+
+from bounbot import httpclient, scraping
+from bounbot.sources import SOURCES
+
+class StubFetchTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.page = load_fixtures()['main']
+        self.url = SOURCES['main']['url']
+        self.servers = []
+        httpclient.breakers.clear()
+        scraping.http_cache.clear()
+        scraping.pending_http_cache.clear()
+
+    async def asyncTearDown(self):
+        await httpclient.close_http_client()
+
+    def tearDown(self):
+        SOURCES['main']['url'] = self.url
+        for server in self.servers:
+            server.stop() # Blocks for up to half a second, so not on the event loop
+
+    def serve(self, behaviour, **kwargs) -> StubServer:
+        server = StubServer(self.page, behaviour, **kwargs)
+        self.servers.append(server)
+        SOURCES['main']['url'] = server.url()
+        return server
+
+    async def test_redirect_is_followed(self):
+        server = self.serve('redirect')
+        response = await httpclient.get_with_retries(server.url(), 'main')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(str(response.url), f"{server.url()}moved")
+        self.assertTrue(await scraping.fetch_announcements('main'))
+        self.assertEqual(httpclient.get_breaker('main').failures, 0)
+
+    async def test_503_is_retried(self):
+        server = self.serve('failing', failures=httpclient.FETCH_RETRIES)
+        with mock.patch.object(httpclient, 'FETCH_RETRY_BASE', 0.01):
+            response = await httpclient.get_with_retries(server.url(), 'main')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.requests, httpclient.FETCH_RETRIES + 1)
+
+    async def test_last_503_is_returned_when_retries_run_out(self):
+        server = self.serve('failing', failures=100)
+        with mock.patch.object(httpclient, 'FETCH_RETRY_BASE', 0.01):
+            response = await httpclient.get_with_retries(server.url(), 'main')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(server.requests, httpclient.FETCH_RETRIES + 1)
+
+    async def test_retry_after_is_honoured(self):
+        server = self.serve('failing', failures=1, retry_after=1)
+        started = time.monotonic()
+        with mock.patch.object(httpclient, 'FETCH_RETRY_BASE', 0.0): # Without the header the retry would be immediate
+            response = await httpclient.get_with_retries(server.url(), 'main')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - started, 1.0)
+        self.assertEqual(server.requests, 2)
+
+    async def fail_until_open(self, breaker):
+        for _ in range(httpclient.BREAKER_THRESHOLD - 1):
+            self.assertEqual(await scraping.fetch_announcements('main'), [])
+            self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(await scraping.fetch_announcements('main'), [])
+        self.assertEqual(breaker.state, 'open')
+
+    def end_cooldown(self, breaker):
+        breaker.open_until = time.monotonic() - 1
+
+    async def test_breaker_opens_after_threshold_and_probe_closes_it(self):
+        server = self.serve('failing', failures=httpclient.BREAKER_THRESHOLD)
+        breaker = httpclient.get_breaker('main')
+        with mock.patch.object(httpclient, 'FETCH_RETRIES', 0):
+            await self.fail_until_open(breaker)
+            self.assertFalse(breaker.allow()) # The source is skipped during the cooldown
+            self.assertAlmostEqual(breaker.retry_in(), httpclient.BREAKER_COOLDOWN, delta=5)
+            self.end_cooldown(breaker)
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, 'half_open')
+            self.assertTrue(await scraping.fetch_announcements('main')) # The probe works
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual((breaker.failures, breaker.cooldown), (0, httpclient.BREAKER_COOLDOWN))
+        self.assertEqual(server.requests, httpclient.BREAKER_THRESHOLD + 1)
+
+    async def test_failed_probe_doubles_the_cooldown(self):
+        self.serve('failing', failures=100)
+        breaker = httpclient.get_breaker('main')
+        with mock.patch.object(httpclient, 'FETCH_RETRIES', 0):
+            await self.fail_until_open(breaker)
+            self.end_cooldown(breaker)
+            self.assertTrue(breaker.allow())
+            self.assertEqual(await scraping.fetch_announcements('main'), []) # The probe fails
+            self.assertEqual(breaker.state, 'open')
+            self.assertEqual(breaker.cooldown, 2 * httpclient.BREAKER_COOLDOWN)
+            self.assertAlmostEqual(breaker.retry_in(), 2 * httpclient.BREAKER_COOLDOWN, delta=5)
+            self.end_cooldown(breaker)
+            breaker.allow()
+            await scraping.fetch_announcements('main')
+        self.assertEqual(breaker.cooldown, 4 * httpclient.BREAKER_COOLDOWN)
+
+if __name__ == '__main__':
+    unittest.main()
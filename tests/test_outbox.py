@@ -0,0 +1,185 @@
+# Outbox delivery (dispatcher.drain_outbox) with the fake Bot of bench/fakes.py: backoff, giving
+# up, merged rows, resuming after a crash or a failed send, and a failing outbox write.
+#
+#   python -m unittest discover tests
+
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from fakes import FakeBot
+from telegram.error import NetworkError
+
+from bounbot import db, dispatcher, rendering
+
+class ScriptedBot(FakeBot):
+    # FakeBot that keeps every message and fails the sends `fail` picks: fail(chat_id, text, messages so far) -> bool
+    def __init__(self, latency=0.0, fail=None):
+        super().__init__(latency)
+        self.fail = fail
+        self.messages = [] # (chat id, text)
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if self.fail and self.fail(chat_id, text, len(self.messages)):
+            raise NetworkError("Connection reset")
+        await super().send_message(chat_id, text, parse_mode)
+        self.messages.append((chat_id, text))
+
+class OutboxTest(unittest.IsolatedAsyncioTestCase):
+    # One database for the class: the DB executor threads keep their connections between tests,
+    # so every test empties the outbox instead
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.old_db_path = db.db_path
+        db.db_path = os.path.join(cls.tmp, 'test.db')
+        db.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.db_path = cls.old_db_path
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def setUp(self):
+        with db.get_db() as conn:
+            conn.execute("DELETE FROM outbox")
+            conn.execute("DELETE FROM outbox_batches")
+        rendering.render_cache.clear()
+        dispatcher.unfinished_outbox.clear()
+        self.limits = dispatcher.send_bucket, dispatcher.chat_limiter
+        dispatcher.send_bucket = dispatcher.TokenBucket(10_000)
+        dispatcher.chat_limiter = dispatcher.PerChatLimiter(0)
+
+    def tearDown(self):
+        dispatcher.send_bucket, dispatcher.chat_limiter = self.limits
+
+    def queue(self, announcements: list[str], chat_ids, attempts=0) -> int:
+        with db.get_db() as conn:
+            batch_id = conn.execute("INSERT INTO outbox_batches (typ, announcements) VALUES ('main', ?)",
+                                    (json.dumps(announcements),)).lastrowid
+            conn.executemany("INSERT INTO outbox (chat_id, batch_id, attempts, next_attempt_at) VALUES (?, ?, ?, 0)",
+                             [(chat_id, batch_id, attempts) for chat_id in chat_ids])
+        return batch_id
+
+    def outbox(self) -> list[tuple]:
+        return db.get_db().execute("SELECT chat_id, batch_id, attempts, next_attempt_at, parts_sent FROM outbox ORDER BY id").fetchall()
+
+    def make_due(self):
+        with db.get_db() as conn:
+            conn.execute("UPDATE outbox SET next_attempt_at = 0")
+
+    def batch_count(self) -> int:
+        return db.get_db().execute("SELECT COUNT(*) FROM outbox_batches").fetchone()[0]
+
+    async def test_delivered_rows_and_batches_are_removed(self):
+        self.queue(["Duyuru 1 (test)."], [1, 2, 3])
+        bot = ScriptedBot()
+        stats = await dispatcher.drain_outbox(bot)
+        self.assertEqual(stats, {'payloads': 1, 'messages': 3})
+        self.assertEqual(sorted(chat_id for chat_id, _ in bot.messages), [1, 2, 3])
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.batch_count(), 0)
+
+    async def test_failed_send_is_retried_with_backoff(self):
+        batch_id = self.queue(["Duyuru 1 (test)."], [1, 2])
+        started = time.time()
+        await dispatcher.drain_outbox(ScriptedBot(fail=lambda chat_id, text, sent: chat_id == 2))
+        [(chat_id, row_batch, attempts, next_attempt_at, _)] = self.outbox()
+        self.assertEqual((chat_id, row_batch, attempts), (2, batch_id, 1))
+        self.assertGreaterEqual(next_attempt_at, started + dispatcher.OUTBOX_BASE_BACKOFF * 2)
+        self.assertEqual(self.batch_count(), 1) # Still needed by the retried row
+
+        bot = ScriptedBot()
+        await dispatcher.drain_outbox(bot) # Not due yet
+        self.assertEqual(bot.messages, [])
+        self.make_due()
+        await dispatcher.drain_outbox(bot)
+        self.assertEqual([chat_id for chat_id, _ in bot.messages], [2])
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.batch_count(), 0)
+
+    async def test_gives_up_after_max_attempts(self):
+        self.queue(["Duyuru 1 (test)."], [1], attempts=dispatcher.OUTBOX_MAX_ATTEMPTS - 1)
+        bot = ScriptedBot(fail=lambda chat_id, text, sent: True)
+        await dispatcher.drain_outbox(bot)
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.batch_count(), 0)
+
+    async def test_merged_rows_are_retried_together(self):
+        self.queue(["Duyuru 1 (test)."], [1])
+        self.queue(["Duyuru 2 (test)."], [1])
+        await dispatcher.drain_outbox(ScriptedBot(fail=lambda chat_id, text, sent: True))
+        rows = self.outbox()
+        self.assertEqual([(attempts, parts_sent) for _, _, attempts, _, parts_sent in rows], [(1, 0), (1, 0)])
+        self.assertEqual(len({next_attempt_at for _, _, _, next_attempt_at, _ in rows}), 1)
+
+        self.make_due()
+        bot = ScriptedBot()
+        await dispatcher.drain_outbox(bot)
+        [(chat_id, text)] = bot.messages # One message for both batches
+        self.assertIn("Duyuru 1", text)
+        self.assertIn("Duyuru 2", text)
+        self.assertEqual(self.outbox(), [])
+
+    async def test_partly_sent_message_is_resumed(self):
+        self.queue([f"Uzun duyuru {i} {'x' * 300} (test)." for i in range(30)], [1])
+        failures = iter([False, True]) # The second part fails once
+        bot = ScriptedBot(fail=lambda chat_id, text, sent: next(failures, False))
+        await dispatcher.drain_outbox(bot)
+        [(_, _, attempts, _, parts_sent)] = self.outbox()
+        self.assertEqual((attempts, parts_sent), (1, 1))
+
+        self.make_due()
+        await dispatcher.drain_outbox(bot)
+        texts = [text for _, text in bot.messages]
+        self.assertGreater(len(texts), 2)
+        self.assertEqual(len(set(texts)), len(texts)) # No part twice
+        self.assertEqual(self.outbox(), [])
+
+    async def test_crash_resumes_without_resending_finished_chats(self):
+        chat_ids = list(range(1, 3 * dispatcher.OUTBOX_FINISH_SIZE + 1))
+        self.queue(["Duyuru 1 (test)."], chat_ids)
+        first = ScriptedBot(latency=0.02)
+        drain = asyncio.create_task(dispatcher.drain_outbox(first))
+        while len(self.outbox()) == len(chat_ids): # Until the first sub-batch is finished
+            await asyncio.sleep(0.01)
+        drain.cancel() # The process dies
+        with self.assertRaises(asyncio.CancelledError):
+            await drain
+        await asyncio.sleep(0.05) # Let a write already handed to the DB thread land
+        left = {chat_id for chat_id, *_ in self.outbox()}
+        self.assertTrue(left)
+
+        second = ScriptedBot()
+        await dispatcher.drain_outbox(second)
+        self.assertEqual({chat_id for chat_id, _ in second.messages}, left)
+        self.assertEqual(len(second.messages), len(left))
+        self.assertEqual({chat_id for chat_id, _ in first.messages} | left, set(chat_ids))
+        self.assertEqual(self.outbox(), [])
+
+    async def test_failed_outbox_write_stops_the_drain(self):
+        self.queue(["Duyuru 1 (test)."], [1, 2, 3])
+        bot = ScriptedBot()
+        with mock.patch.object(dispatcher, 'finish_outbox', side_effect=sqlite3.OperationalError("database is locked")):
+            await asyncio.wait_for(dispatcher.drain_outbox(bot), timeout=5)
+            await dispatcher.drain_outbox(bot) # Still failing: the outbox is not read again
+        self.assertEqual(len(bot.messages), 3)
+        self.assertEqual(len(self.outbox()), 3)
+        await dispatcher.drain_outbox(bot) # The kept outcome is written first
+        self.assertEqual(len(bot.messages), 3)
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.batch_count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
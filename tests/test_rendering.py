@@ -0,0 +1,46 @@
+# Render cache (rendering.cached_render): a payload rendered while its source was invalidated
+# must not be stored.
+#
+#   python -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bounbot import rendering
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        rendering.render_cache.clear()
+
+    def test_payload_is_cached(self):
+        calls = []
+        render = lambda: calls.append(1) or ['payload']
+        self.assertEqual(rendering.cached_render(('latest', 'main', 5), render), ['payload'])
+        self.assertEqual(rendering.cached_render(('latest', 'main', 5), render), ['payload'])
+        self.assertEqual(len(calls), 1)
+
+    def test_render_racing_an_invalidation_is_not_stored(self):
+        # New announcements of the source arrive while /latest and /search are rendering
+        def render():
+            rendering.invalidate_rendered('main')
+            return ['stale']
+        self.assertEqual(rendering.cached_render(('latest', 'main', 5), render), ['stale'])
+        self.assertEqual(rendering.cached_render(('search', ('sınav',), 0), render), ['stale'])
+        self.assertNotIn(('latest', 'main', 5), rendering.render_cache)
+        self.assertNotIn(('search', ('sınav',), 0), rendering.render_cache)
+
+    def test_other_sources_are_not_affected(self):
+        def render():
+            rendering.invalidate_rendered('mis')
+            return ['fresh']
+        rendering.cached_render(('latest', 'main', 5), render)
+        rendering.cached_render(('new', 'main', (1, 3)), render)
+        self.assertEqual(rendering.render_cache[('latest', 'main', 5)], ['fresh'])
+        self.assertEqual(rendering.render_cache[('new', 'main', (1, 3))], ['fresh'])
+
+if __name__ == '__main__':
+    unittest.main()
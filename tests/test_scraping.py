@@ -0,0 +1,73 @@
+# Conditional GETs in scheduler.check_source against the fixture pages: the validators of a page
+# are only kept once its announcements are diffed, so a failed poll fetches and diffs it again.
+#
+#   python -m unittest discover tests
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from fakes import FixtureServer, load_fixtures
+
+from bounbot import announcements, db, httpclient, scheduler, scraping, users
+from bounbot.sources import SOURCES
+
+class ConditionalFetchTest(unittest.IsolatedAsyncioTestCase):
+    # One database for the class: the DB executor threads keep their connections between tests,
+    # so every test polls its own source instead
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.old_db_path = db.db_path
+        db.db_path = os.path.join(cls.tmp, 'test.db')
+        db.init_db()
+        users.load_subscription_cache()
+        announcements.seen_cache.clear()
+        cls.urls = {typ: source['url'] for typ, source in SOURCES.items()}
+        cls.server = FixtureServer(load_fixtures())
+        cls.server.start()
+        for typ in SOURCES:
+            SOURCES[typ]['url'] = cls.server.url(typ)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        for typ, url in cls.urls.items():
+            SOURCES[typ]['url'] = url
+        db.db_path = cls.old_db_path
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    async def asyncTearDown(self):
+        await httpclient.close_http_client() # Its clients belong to this test's event loop
+
+    async def test_diffed_page_is_not_fetched_again(self):
+        self.assertEqual(await scheduler.check_source('main'), 'changed')
+        self.assertIn('main', scraping.http_cache)
+        self.assertEqual(await scheduler.check_source('main'), 'unchanged')
+        self.assertEqual(scraping.http_cache_stats['main']['not_modified'], 1)
+
+    async def test_parse_failures_keep_the_old_validators(self):
+        with mock.patch.object(scraping, 'extract_announcements', return_value=[]):
+            self.assertEqual(await scheduler.check_source('yadyok'), 'failed')
+        with mock.patch.object(scraping, 'extract_announcements', side_effect=ValueError("broken markup")):
+            self.assertEqual(await scheduler.check_source('yadyok'), 'failed')
+        self.assertNotIn('yadyok', scraping.http_cache)
+        self.assertEqual(await scheduler.check_source('yadyok'), 'changed')
+
+    async def test_db_failure_keeps_the_old_validators(self):
+        with mock.patch.object(scheduler, 'diff_and_persist', side_effect=sqlite3.OperationalError("database is locked")):
+            self.assertEqual(await scheduler.check_source('mis'), 'failed')
+        self.assertNotIn('mis', scraping.http_cache)
+        self.assertEqual(await scheduler.check_source('mis'), 'changed')
+        self.assertEqual(await scheduler.check_source('mis'), 'unchanged')
+
+if __name__ == '__main__':
+    unittest.main()
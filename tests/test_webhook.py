@@ -0,0 +1,90 @@
+# Webhook server (webhook.handle_webhook_connection) over a real socket: every status it answers
+# with, and that an accepted update reaches a handler of the Application.
+#
+#   python -m unittest discover tests
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from fakes import load_webhook_updates, offline_application
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from bounbot import webhook
+
+class WebhookTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.application = offline_application()
+        await self.application.initialize()
+        self.queue = asyncio.Queue(maxsize=4)
+        self.server = await asyncio.start_server(
+            lambda reader, writer: webhook.handle_webhook_connection(self.application, self.queue, reader, writer),
+            '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.update = {**load_webhook_updates()[0], 'update_id': 1}
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.application.shutdown()
+
+    async def post(self, body: bytes, secret=webhook.WEBHOOK_SECRET, method='POST', path=webhook.WEBHOOK_PATH,
+                   length=None) -> int:
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        request = f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n"
+        if secret is not None:
+            request += f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+        request += f"Content-Length: {len(body) if length is None else length}\r\n\r\n"
+        writer.write(request.encode() + body) # UTF-8, so a non-ASCII secret arrives as raw bytes
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        writer.close()
+        return status
+
+    async def test_update_is_queued_and_handled(self):
+        self.assertEqual(await self.post(json.dumps(self.update).encode()), 200)
+        self.assertEqual(self.queue.qsize(), 1)
+        handled = []
+
+        async def handler(update, context):
+            handled.append(update.update_id)
+        self.application.add_handler(TypeHandler(Update, handler))
+        worker = asyncio.create_task(webhook.process_webhook_updates(self.application, self.queue))
+        await asyncio.wait_for(self.queue.join(), timeout=5)
+        worker.cancel()
+        self.assertEqual(handled, [1])
+
+    async def test_wrong_or_missing_secret_is_forbidden(self):
+        body = json.dumps(self.update).encode()
+        self.assertEqual(await self.post(body, secret='wrong'), 403)
+        self.assertEqual(await self.post(body, secret=None), 403)
+        self.assertEqual(await self.post(body, secret='sır'), 403)
+        self.assertTrue(self.queue.empty())
+
+    async def test_malformed_payload_is_rejected(self):
+        self.assertEqual(await self.post(b'{"update_id": '), 400)
+        self.assertEqual(await self.post(b'[1, 2]'), 400)
+        self.assertTrue(self.queue.empty())
+
+    async def test_oversize_body_is_rejected(self):
+        self.assertEqual(await self.post(b'', length=webhook.WEBHOOK_MAX_BODY + 1), 413)
+
+    async def test_full_queue_asks_for_a_retry(self):
+        while not self.queue.full():
+            self.queue.put_nowait(None)
+        self.assertEqual(await self.post(json.dumps(self.update).encode()), 503)
+
+    async def test_wrong_path_and_method(self):
+        body = json.dumps(self.update).encode()
+        self.assertEqual(await self.post(body, path='/other'), 404)
+        self.assertEqual(await self.post(b'', method='GET'), 405)
+
+if __name__ == '__main__':
+    unittest.main()